@@ -0,0 +1,173 @@
+import time
+import logging
+import threading
+import subprocess
+import metrics
+
+try:
+    import dbus
+    import dbus.mainloop.glib
+    from gi.repository import GLib
+except ImportError:
+    dbus = None
+
+# Cached Bluetooth adapter power state.
+#
+# BluetoothService keeps the adapter's Powered property in memory, so
+# asking for it costs nothing. With BlueZ on D-Bus the cache is updated
+# from PropertiesChanged signals and power is switched with a property
+# Set call. Without dbus-python we fall back to bluetoothctl, re-reading
+# the state at most every refresh_interval seconds. FakeAdapter stands in
+# for the radio in tests and benchmarks.
+
+get_power_time = metrics.histogram('flick_bluetooth_get_power_seconds', 'Adapter power state reads')
+set_power_time = metrics.histogram('flick_bluetooth_set_power_seconds', 'Adapter power changes')
+
+BLUEZ = 'org.bluez'
+ADAPTER_INTERFACE = 'org.bluez.Adapter1'
+PROPERTIES_INTERFACE = 'org.freedesktop.DBus.Properties'
+
+
+class DBusAdapter(object):
+    def __init__(self, path='/org/bluez/hci0'):
+        if dbus is None:
+            raise RuntimeError('dbus-python is not installed')
+        dbus.mainloop.glib.threads_init()
+        self.path = path
+        self.bus = dbus.SystemBus(mainloop=dbus.mainloop.glib.DBusGMainLoop())
+        self.properties = dbus.Interface(self.bus.get_object(BLUEZ, path), PROPERTIES_INTERFACE)
+        self.loop = None
+
+    def get_powered(self):
+        return bool(self.properties.Get(ADAPTER_INTERFACE, 'Powered'))
+
+    def set_powered(self, state):
+        self.properties.Set(ADAPTER_INTERFACE, 'Powered', dbus.Boolean(state))
+
+    def subscribe(self, callback):
+        def on_properties_changed(interface, changed, invalidated):
+            if interface == ADAPTER_INTERFACE and 'Powered' in changed:
+                callback(bool(changed['Powered']))
+
+        self.bus.add_signal_receiver(on_properties_changed, 'PropertiesChanged',
+                                     PROPERTIES_INTERFACE, BLUEZ, self.path)
+        # Signals are delivered from a GLib main loop in its own thread
+        self.loop = GLib.MainLoop()
+        thread = threading.Thread(target=self.loop.run)
+        thread.daemon = True
+        thread.start()
+        return True
+
+
+class SubprocessAdapter(object):
+    def get_powered(self):
+        result = subprocess.run(['bluetoothctl', 'show'], capture_output=True, text=True)
+        return 'Powered: yes' in result.stdout
+
+    def set_powered(self, state):
+        subprocess.run(['bluetoothctl', 'power', 'on' if state else 'off'])
+
+    def subscribe(self, callback):
+        return False  # No change notifications, BluetoothService re-reads instead
+
+
+class FakeAdapter(object):
+    """In-memory adapter that behaves like BlueZ over D-Bus"""
+
+    def __init__(self, powered=False):
+        self.powered = powered
+        self.callbacks = []
+        self.gets = 0
+        self.sets = 0
+
+    def get_powered(self):
+        self.gets += 1
+        return self.powered
+
+    def set_powered(self, state):
+        self.sets += 1
+        self.external_change(state)
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+        return True
+
+    def external_change(self, powered):
+        """Simulate the adapter changing state, e.g. toggled with bluetoothctl"""
+        changed = self.powered != powered
+        self.powered = powered
+        if changed:
+            for callback in self.callbacks:
+                callback(powered)
+
+
+class BluetoothService(object):
+    def __init__(self, adapter=None, refresh_interval=30):
+        if adapter is None:
+            adapter = open_adapter()
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        try:
+            with get_power_time.time():
+                powered = adapter.get_powered()
+        except Exception as e:
+            # e.g. D-Bus is up but bluetoothd or hci0 is not
+            logging.error(f'Could not read Bluetooth power state, using bluetoothctl: {e}')
+            adapter = SubprocessAdapter()
+            try:
+                powered = adapter.get_powered()
+            except Exception as e:
+                logging.error(f'Could not read Bluetooth power state, assuming off: {e}')
+                powered = False
+        self.adapter = adapter
+        self.powered = powered
+        self.read_at = time.monotonic()
+        self.listeners = []
+        self.signals = adapter.subscribe(self._on_powered)
+
+    def _on_powered(self, powered):
+        with self.lock:
+            changed = powered != self.powered
+            self.powered = powered
+            self.read_at = time.monotonic()
+        if changed:
+            logging.info(f"Bluetooth powered {'on' if powered else 'off'}")
+            for listener in self.listeners:
+                listener(powered)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def is_powered(self):
+        if not self.signals and time.monotonic() - self.read_at >= self.refresh_interval:
+            try:
+                with get_power_time.time():
+                    powered = self.adapter.get_powered()
+                self._on_powered(powered)
+            except Exception as e:
+                logging.error(f'Error reading Bluetooth power state: {e}')
+                self.read_at = time.monotonic()  # Keep the cached state until the next refresh
+        with self.lock:
+            return self.powered
+
+    def set_power(self, state):
+        if self.is_powered() == state:
+            return
+        try:
+            with set_power_time.time():
+                self.adapter.set_powered(state)
+        except Exception as e:
+            logging.error(f'Error setting Bluetooth power: {e}')
+            return
+        if not self.signals:
+            self._on_powered(state)
+
+
+def open_adapter():
+    """BlueZ over D-Bus if available, bluetoothctl otherwise"""
+    if dbus is not None:
+        try:
+            return DBusAdapter()
+        except Exception as e:
+            logging.error(f'Could not reach BlueZ over D-Bus, using bluetoothctl: {e}')
+    return SubprocessAdapter()
@@ -0,0 +1,82 @@
+import threading
+import flickframe
+import i2c
+
+# Simulated MGC3130 (the Flick board) behind the I2C bus, for running
+# flicklib off the Pi.
+#
+# It stands in for i2c.I2CMaster: install it with
+#   i2c.I2CMaster = lambda *args, **kwargs: fake
+# before flicklib is imported. Frames are handed over like the real chip
+# does it, by pulling the transfer line low on the GPIO backend (e.g.
+# mockgpio.MockGPIO) until the frame has been read.
+
+XFER_PIN = 27
+
+FIRMWARE_INFO = bytes([0x84, 0, 0, 0x83, 0xaa, 1, 0, 0, 1, 0, 0, 0]) + b'1.0.0 fake\0'
+
+
+def sensor_frame(gesture=0, touch=0):
+    """26 byte sensor data frame with a gesture ID and/or touch bits"""
+    frame = bytearray(flickframe.SENSOR_FRAME.pack(0b110, 0, gesture, 1, touch, 0, 0, 0, 0, 0))
+    frame[0:4] = bytes([flickframe.SENSOR_FRAME_SIZE, 0, 1, 0x91])
+    return bytes(frame)
+
+
+def flick_frame(start='west', finish='east'):
+    return sensor_frame(gesture=flickframe.GESTURES.index(('flick', start, finish)))
+
+
+class FakeMGC3130(object):
+    """Stands in for i2c.I2CMaster with an MGC3130 behind it"""
+
+    def __init__(self, gpio, xfer_pin=XFER_PIN):
+        self.gpio = gpio
+        self.xfer_pin = xfer_pin
+        self.lock = threading.Lock()
+        self.pending = None
+        self.reads = 0
+        self.frame_buffer = bytearray(flickframe.SENSOR_FRAME_SIZE)
+
+    def send(self, frame):
+        # Data ready: load the frame and pull the transfer line low
+        with self.lock:
+            self.pending = frame
+        self.gpio.set_input(self.xfer_pin, self.gpio.LOW)
+
+    def flick(self, start='west', finish='east'):
+        self.send(flick_frame(start, finish))
+
+    def firmware_ready(self):
+        # Right after reset the chip has its firmware info ready
+        self.gpio.set_input(self.xfer_pin, self.gpio.LOW)
+
+    def _take(self):
+        with self.lock:
+            frame = self.pending or bytes(flickframe.SENSOR_FRAME_SIZE)
+            self.pending = None
+            self.reads += 1
+        self.gpio.set_input(self.xfer_pin, self.gpio.HIGH)  # Transfer done, line released
+        return frame
+
+    def transaction(self, *msgs):
+        results = []
+        for msg in msgs:
+            if msg.flags & i2c.I2C_M_RD:
+                # Only the firmware info is read this way
+                frame = bytearray(msg.len)
+                frame[0:len(FIRMWARE_INFO)] = FIRMWARE_INFO
+                self._take()
+                results.append(bytes(frame))
+        return results
+
+    def prepare_read(self, addr, n_bytes):
+        view = memoryview(self.frame_buffer)
+
+        def read():
+            self.frame_buffer[:] = self._take()
+            return view
+        return read
+
+    def close(self):
+        pass
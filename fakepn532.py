@@ -0,0 +1,175 @@
+import time
+import threading
+
+# Simulated PN532 with NTAG215 tags, for running the NFC code off the Pi.
+#
+# It mimics the adafruit_pn532 PN532_I2C methods used in this repo. Every
+# call that would talk to the chip counts as a bus transaction and can be
+# given a fixed latency. Tags are placed on and removed from the reader with
+# place() / remove(). If a GPIO backend (e.g. mockgpio.MockGPIO) and IRQ pin
+# are given, the IRQ line is pulled low when an armed target detection
+# completes, like the real chip does. It also pulses low for the ACK frame
+# of InListPassiveTarget, which the driver reads before returning.
+
+NTAG215_PAGES = 135
+
+
+class FakeTag(object):
+    def __init__(self, uid, data=b'', pages=NTAG215_PAGES):
+        self.uid = bytearray(uid)
+        self.memory = bytearray(pages * 4)
+        # Capability container of an NTAG215
+        self.memory[12:16] = b'\xe1\x10\x3e\x00'
+        self.memory[16:16 + len(data)] = data
+
+    @property
+    def pages(self):
+        return len(self.memory) // 4
+
+
+class FakePN532(object):
+    def __init__(self, gpio=None, irq_pin=None, latency=0.0, poll_interval=0.01):
+        self.gpio = gpio
+        self.irq_pin = irq_pin
+        self.latency = latency
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.present = threading.Condition(self.lock)
+        self.tag = None
+        self.armed = False
+        self.response = None  # UID of a detection not read yet
+        self.bad_frames = 0   # Responses to corrupt, see corrupt_next()
+        self.transactions = 0
+        if gpio is not None and irq_pin is not None:
+            gpio.setup(irq_pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+
+    # Test hooks
+
+    def place(self, tag):
+        with self.lock:
+            self.tag = tag
+            self.present.notify_all()
+            fire = self.armed
+            self.armed = False
+            if fire:
+                self.response = bytearray(tag.uid)
+        if fire:
+            self._irq(False)
+
+    def corrupt_next(self, count=1):
+        """The next count target responses fail their checksum, like I2C noise does"""
+        with self.lock:
+            self.bad_frames += count
+
+    def remove(self):
+        with self.lock:
+            self.tag = None
+
+    def _irq(self, level):
+        if self.gpio is not None and self.irq_pin is not None:
+            self.gpio.set_input(self.irq_pin, level)
+
+    def _transaction(self):
+        with self.lock:
+            self.transactions += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _selected(self):
+        if self.tag is None:
+            raise RuntimeError('Did not receive expected ACK from PN532!')
+        return self.tag
+
+    # adafruit_pn532 API
+
+    def SAM_configuration(self):
+        self._transaction()
+
+    @property
+    def firmware_version(self):
+        self._transaction()
+        return (0x32, 1, 6, 7)
+
+    def read_passive_target(self, card_baud=0, timeout=1):
+        # The driver sends InListPassiveTarget, then polls the status byte
+        # over I2C until the chip answers or the timeout runs out.
+        self._transaction()
+        end = time.monotonic() + timeout
+        while True:
+            self._transaction()
+            with self.lock:
+                if self.tag is not None:
+                    return bytearray(self.tag.uid)
+            if time.monotonic() >= end:
+                return None
+            time.sleep(self.poll_interval)
+
+    def listen_for_passive_target(self, card_baud=0, timeout=1):
+        self._transaction()
+        # IRQ goes low for the ACK frame and back up once it has been read
+        self._irq(False)
+        self._irq(True)
+        with self.lock:
+            fire = self.tag is not None
+            self.armed = not fire
+            self.response = bytearray(self.tag.uid) if fire else None
+        if fire:
+            self._irq(False)
+        return True
+
+    def get_passive_target(self, timeout=1):
+        self._transaction()
+        with self.lock:
+            response, self.response = self.response, None
+            bad = response is not None and self.bad_frames > 0
+            if bad:
+                self.bad_frames -= 1
+        if response is None:
+            return None  # Nothing detected yet, the command is still pending
+        self._irq(True)
+        if bad:
+            raise RuntimeError('Response checksum did not match expected value')
+        return response
+
+    def call_function(self, command, response_length=0, params=[], timeout=1):
+        # Only InDataExchange with the NTAG READ, FAST_READ and WRITE commands
+        self._transaction()
+        if command != 0x40 or len(params) < 3:
+            return None
+        tag = self._selected()
+        if params[1] == 0x30:
+            return bytearray([0x00]) + self._read_pages(tag, params[2])
+        if params[1] == 0x3A and len(params) >= 4:
+            first, last = params[2], params[3]
+            if first > last or last >= tag.pages:
+                return bytearray([0x01])
+            return bytearray([0x00]) + tag.memory[first * 4:(last + 1) * 4]
+        if params[1] == 0xA2 and len(params) >= 7:
+            if not 4 <= params[2] < tag.pages:
+                return bytearray([0x01])
+            tag.memory[params[2] * 4:params[2] * 4 + 4] = bytes(params[3:7])
+            return bytearray([0x00])
+        return bytearray([0x01])
+
+    def _read_pages(self, tag, first):
+        # NTAG READ returns 4 pages (16 bytes), wrapping at the end of memory
+        data = bytearray()
+        for page in range(first, first + 4):
+            offset = (page % tag.pages) * 4
+            data += tag.memory[offset:offset + 4]
+        return data
+
+    def ntag2xx_read_block(self, block_number):
+        return self.mifare_classic_read_block(block_number)[0:4]
+
+    def mifare_classic_read_block(self, block_number):
+        self._transaction()
+        return self._read_pages(self._selected(), block_number)
+
+    def ntag2xx_write_block(self, block_number, data):
+        self._transaction()
+        tag = self._selected()
+        if len(data) != 4 or not 4 <= block_number < tag.pages:
+            return False
+        tag.memory[block_number * 4:block_number * 4 + 4] = data
+        return True
@@ -0,0 +1,275 @@
+import os
+import time
+import threading
+
+# Simulated python-vlc, for running flick.py off the Pi.
+#
+# Install it with sys.modules['vlc'] = fakevlc before flick.py is
+# imported. It covers the part of the vlc API flick.py uses. A media list
+# player "plays" each item for track_seconds after an open delay, and
+# sends the same events as libvlc does, from its own thread. Every call
+# and event is passed to on_event(kind, detail) if it is set, which is how
+# the simulation records what the player did.
+
+track_seconds = 2.0   # How long every track plays
+open_seconds = 0.005  # Time to open a track before it starts playing
+on_event = None
+
+
+def _record(kind, detail=None):
+    if callable(on_event):
+        on_event(kind, detail)
+
+
+class EventType(object):
+    MediaListPlayerPlayed = 'MediaListPlayerPlayed'
+    MediaListPlayerNextItemSet = 'MediaListPlayerNextItemSet'
+    MediaListPlayerStopped = 'MediaListPlayerStopped'
+    MediaPlayerEndReached = 'MediaPlayerEndReached'
+    MediaPlayerPlaying = 'MediaPlayerPlaying'
+    MediaPlayerPaused = 'MediaPlayerPaused'
+    MediaPlayerStopped = 'MediaPlayerStopped'
+
+
+class MediaParseFlag(object):
+    local = 0
+    network = 1
+
+
+class MediaParsedStatus(object):
+    skipped = 1
+    failed = 2
+    timeout = 3
+    done = 4
+
+
+class Event(object):
+    def __init__(self, event_type):
+        self.type = event_type
+
+
+class EventManager(object):
+    def __init__(self):
+        self.callbacks = {}
+
+    def event_attach(self, event_type, callback, *args):
+        self.callbacks.setdefault(event_type, []).append((callback, args))
+
+    def event_detach(self, event_type):
+        self.callbacks.pop(event_type, None)
+
+    def _send(self, event_type):
+        for callback, args in self.callbacks.get(event_type, []):
+            callback(Event(event_type), *args)
+
+
+class Media(object):
+    def __init__(self, path):
+        self.path = path
+        self.parsed = None
+
+    def get_mrl(self):
+        return 'file://' + os.path.abspath(self.path).replace(' ', '%20')
+
+    def parse_with_options(self, flags, timeout):
+        self.parsed = MediaParsedStatus.done
+        return 0
+
+    def get_parsed_status(self):
+        return self.parsed
+
+    def release(self):
+        pass
+
+
+class MediaList(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = []
+
+    def add_media(self, media):
+        with self.lock:
+            self.items.append(media)
+        return 0
+
+    def count(self):
+        with self.lock:
+            return len(self.items)
+
+    def item_at_index(self, index):
+        with self.lock:
+            return self.items[index] if 0 <= index < len(self.items) else None
+
+    def index_of_item(self, media):
+        with self.lock:
+            for index, item in enumerate(self.items):
+                if item is media:
+                    return index
+        return -1
+
+    def release(self):
+        pass
+
+
+class MediaPlayer(object):
+    def __init__(self):
+        self.events = EventManager()
+        self.media = None
+        self.volume = 100
+
+    def event_manager(self):
+        return self.events
+
+    def get_media(self):
+        return self.media
+
+    def audio_get_volume(self):
+        return self.volume
+
+    def audio_set_volume(self, volume):
+        self.volume = volume
+        return 0
+
+
+class MediaListPlayer(object):
+    def __init__(self):
+        self.events = EventManager()
+        self.media_player = MediaPlayer()
+        self.media_list = None
+        self.lock = threading.Condition()
+        self.generation = 0
+        self.index = 0
+        self.playing = False
+        self.paused = False
+
+    def event_manager(self):
+        return self.events
+
+    def get_media_player(self):
+        return self.media_player
+
+    def set_media_player(self, media_player):
+        self.media_player = media_player
+
+    def set_media_list(self, media_list):
+        with self.lock:
+            self.media_list = media_list
+        _record('set_media_list', media_list.count())
+
+    def play(self):
+        with self.lock:
+            self.generation += 1
+            self.index = 0
+            self.playing = True
+            self.paused = False
+            generation = self.generation
+            self.lock.notify_all()
+        _record('play')
+        thread = threading.Thread(target=self._run, args=(generation,), name='fakevlc')
+        thread.daemon = True
+        thread.start()
+        return 0
+
+    def play_item_at_index(self, index):
+        self.play()
+        with self.lock:
+            self.index = index
+        return 0
+
+    def next(self):
+        with self.lock:
+            self.index += 1
+            self.lock.notify_all()
+        return 0
+
+    def stop(self):
+        with self.lock:
+            was_playing = self.playing
+            self.generation += 1
+            self.playing = False
+            self.lock.notify_all()
+        _record('stop')
+        if was_playing:
+            self.events._send(EventType.MediaListPlayerStopped)
+
+    def pause(self):
+        with self.lock:
+            self.paused = not self.paused
+            self.lock.notify_all()
+        _record('pause', self.paused)
+
+    def is_playing(self):
+        with self.lock:
+            return self.playing and not self.paused
+
+    def _current(self, generation):
+        # Caller holds self.lock
+        if generation != self.generation or self.media_list is None:
+            return None
+        return self.media_list.item_at_index(self.index)
+
+    def _run(self, generation):
+        while True:
+            with self.lock:
+                media = self._current(generation)
+                if generation != self.generation:
+                    return
+                if media is None:
+                    self.playing = False
+                    break
+                index = self.index
+                self.media_player.media = media
+            self.events._send(EventType.MediaListPlayerNextItemSet)
+            time.sleep(open_seconds)
+            with self.lock:
+                if generation != self.generation:
+                    return
+            _record('playing', media.path)
+            self.media_player.events._send(EventType.MediaPlayerPlaying)
+
+            # Play until the track is over, skipped or stopped
+            end = time.monotonic() + track_seconds
+            with self.lock:
+                while generation == self.generation and self.index == index:
+                    remaining = end - time.monotonic()
+                    if self.paused:
+                        end = time.monotonic() + max(remaining, 0)
+                        self.lock.wait(0.05)
+                        continue
+                    if remaining <= 0:
+                        self.index += 1
+                        ended = True
+                        break
+                    self.lock.wait(remaining)
+                else:
+                    ended = False
+                if generation != self.generation:
+                    return
+            if ended:
+                _record('end', media.path)
+                self.media_player.events._send(EventType.MediaPlayerEndReached)
+        _record('played')
+        self.events._send(EventType.MediaListPlayerPlayed)
+
+    def release(self):
+        self.stop()
+
+
+class Instance(object):
+    def __init__(self, *args):
+        self.args = args
+
+    def media_new(self, path):
+        return Media(path)
+
+    def media_list_new(self, paths=None):
+        media_list = MediaList()
+        for path in paths or []:
+            media_list.add_media(Media(path))
+        return media_list
+
+    def media_list_player_new(self):
+        return MediaListPlayer()
+
+    def media_player_new(self):
+        return MediaPlayer()
@@ -0,0 +1,173 @@
+import os
+import re
+import struct
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+
+# FLAC track metadata, read straight from the file headers.
+#
+# Only the metadata blocks at the start of the file are looked at:
+# STREAMINFO for the duration and the Vorbis comment for track and disc
+# number, artist, album and title. Other blocks (pictures, seek tables,
+# padding) are skipped with a seek, so a few KB are read per file. Results
+# are cached in metadata.db keyed by (path, mtime, size), a file is only
+# parsed again when it changes.
+
+STREAMINFO = 0
+VORBIS_COMMENT = 4
+
+BLOCK_HEADER = struct.Struct('>I')
+STREAMINFO_SAMPLES = struct.Struct('>Q')  # Bytes 10-17 of STREAMINFO
+
+FIELDS = ('duration', 'disc', 'track', 'artist', 'album', 'title')
+LEADING_DIGITS = re.compile(r'^\s*(\d+)')
+
+
+class TrackMeta(object):
+    __slots__ = FIELDS
+
+    def __init__(self, duration=None, disc=None, track=None, artist=None, album=None, title=None):
+        self.duration = duration
+        self.disc = disc
+        self.track = track
+        self.artist = artist
+        self.album = album
+        self.title = title
+
+    def as_row(self):
+        return tuple(getattr(self, field) for field in FIELDS)
+
+
+def number(value):
+    """3 for '3', '3/12' or ' 03', None if there is no number"""
+    if value is None:
+        return None
+    match = LEADING_DIGITS.match(value)
+    return int(match.group(1)) if match else None
+
+
+def parse_vorbis_comment(data):
+    comments = {}
+    vendor_length = int.from_bytes(data[0:4], 'little')
+    pos = 4 + vendor_length
+    count = int.from_bytes(data[pos:pos + 4], 'little')
+    pos += 4
+    for _ in range(count):
+        length = int.from_bytes(data[pos:pos + 4], 'little')
+        pos += 4
+        name, _, value = data[pos:pos + length].decode('utf-8', errors='replace').partition('=')
+        pos += length
+        comments.setdefault(name.lower(), value)
+    return comments
+
+
+def read_metadata(path):
+    """TrackMeta from the FLAC headers, raises ValueError for non-FLAC files"""
+    meta = TrackMeta()
+    with open(path, 'rb') as f:
+        if f.read(4) != b'fLaC':
+            raise ValueError(f'{path} is not a FLAC file')
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                break
+            value = BLOCK_HEADER.unpack(header)[0]
+            last = value >> 31
+            block_type = value >> 24 & 0x7f
+            length = value & 0xffffff
+            if block_type == STREAMINFO:
+                data = f.read(length)
+                packed = STREAMINFO_SAMPLES.unpack(data[10:18])[0]
+                sample_rate = packed >> 44
+                total_samples = packed & 0xfffffffff
+                if sample_rate and total_samples:
+                    meta.duration = total_samples / sample_rate
+            elif block_type == VORBIS_COMMENT:
+                comments = parse_vorbis_comment(f.read(length))
+                meta.track = number(comments.get('tracknumber'))
+                meta.disc = number(comments.get('discnumber'))
+                meta.artist = comments.get('artist')
+                meta.album = comments.get('album')
+                meta.title = comments.get('title')
+                break  # Everything we want comes before or in the comment
+            else:
+                f.seek(length, os.SEEK_CUR)
+            if last:
+                break
+    return meta
+
+
+class MetadataCache(object):
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.tracks = {}  # path -> (mtime, size, TrackMeta)
+        self.pending = {}  # Parsed since the last save
+
+    def load(self):
+        if not os.path.exists(self.db_path):
+            return 0
+        try:
+            with closing(sqlite3.connect(self.db_path)) as db:
+                rows = db.execute('SELECT path, mtime, size, ' + ', '.join(FIELDS) + ' FROM tracks').fetchall()
+        except sqlite3.Error as e:
+            logging.error(f'Could not load track metadata {self.db_path}: {e}')
+            return 0
+        with self.lock:
+            self.tracks = {row[0]: (row[1], row[2], TrackMeta(*row[3:])) for row in rows}
+        return len(self.tracks)
+
+    def save(self):
+        """Write the entries parsed since the last save"""
+        with self.lock:
+            if not self.pending:
+                return
+            rows = [(path, mtime, size) + meta.as_row() for path, (mtime, size, meta) in self.pending.items()]
+            self.pending = {}
+        with closing(sqlite3.connect(self.db_path)) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS tracks (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, '
+                       'duration REAL, disc INTEGER, track INTEGER, artist TEXT, album TEXT, title TEXT)')
+            db.executemany('INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            db.commit()
+
+    def get(self, path):
+        """TrackMeta for path, parsed only if the file changed since it was cached"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return TrackMeta()
+        with self.lock:
+            cached = self.tracks.get(path)
+        if cached is not None and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached[2]
+        try:
+            meta = read_metadata(path)
+        except (OSError, ValueError, struct.error) as e:
+            logging.error(f'Could not read metadata of {path}: {e}')
+            meta = TrackMeta()
+        with self.lock:
+            self.tracks[path] = self.pending[path] = (st.st_mtime, st.st_size, meta)
+        return meta
+
+    def sort_key(self, path):
+        # Folder, disc, then track number (or the leading digits of the file
+        # name like the old play_all_songs_in_order), then the name
+        meta = self.get(path)
+        track = meta.track
+        if track is None:
+            track = number(os.path.basename(path))
+        return (os.path.dirname(path), meta.disc or 1, track if track is not None else 1 << 30, path)
+
+    def order(self, paths):
+        """paths sorted into album order"""
+        ordered = sorted(paths, key=self.sort_key)
+        self.save()
+        return ordered
+
+
+def open_cache(db_path):
+    cache = MetadataCache(db_path)
+    cache.load()
+    return cache
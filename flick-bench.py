@@ -0,0 +1,124 @@
+import sys
+import time
+import random
+import tracemalloc
+import flickframe
+
+# Microbenchmark for the MGC3130 sensor frame decoder used by flicklib.
+# Usage: python flick-bench.py [frames]
+#
+# Compares the old pop()/slice based parser with the struct based one in
+# flickframe, on random 26 byte frames with gestures and touches mixed in.
+# Reports frames/second and the transient memory allocated per frame.
+
+SW_DATA_GESTURE = 0b10
+SW_DATA_TOUCH = 0b100
+SW_DATA_AIRWHEEL = 0b1000
+SW_DATA_XYZ = 0b10000
+
+
+def legacy_decode(data):
+    # The parser from flicklib before it moved to flickframe, minus the callbacks
+    data = bytearray(data)
+    data.pop(0)
+    data.pop(0)
+    data.pop(0)
+    data.pop(0)
+    d_configmask = data.pop(0) | data.pop(0) << 8
+    d_timestamp = data.pop(0)
+    d_sysinfo = data.pop(0)
+    d_gesture = data[2:6]
+    d_touch = data[6:10]
+    d_airwheel = data[10:12]
+    d_xyz = data[12:20]
+    result = None
+    if d_configmask & SW_DATA_XYZ and d_sysinfo & 1:
+        result = ((d_xyz[1] << 8 | d_xyz[0]) / 65536.0,
+                  (d_xyz[3] << 8 | d_xyz[2]) / 65536.0,
+                  (d_xyz[5] << 8 | d_xyz[4]) / 65536.0)
+    if d_configmask & SW_DATA_GESTURE and not d_gesture[0] == 0:
+        gestures = [('garbage', '', ''), ('flick', 'west', 'east'), ('flick', 'east', 'west'),
+                    ('flick', 'south', 'north'), ('flick', 'north', 'south'),
+                    ('circle', 'clockwise', ''), ('circle', 'counter-clockwise', '')]
+        for i, gesture in enumerate(gestures):
+            if d_gesture[0] == i + 1:
+                result = gesture
+                break
+    if d_configmask & SW_DATA_TOUCH and not (d_touch[0] == 0 and d_touch[1] == 0):
+        d_action = d_touch[1] << 8 | d_touch[0]
+        actions = [('touch', 'south'), ('touch', 'west'), ('touch', 'north'), ('touch', 'east'),
+                   ('touch', 'center'), ('tap', 'south'), ('tap', 'west'), ('tap', 'north'),
+                   ('tap', 'east'), ('tap', 'center'), ('doubletap', 'south'), ('doubletap', 'west'),
+                   ('doubletap', 'north'), ('doubletap', 'east'), ('doubletap', 'center')]
+        comp = 1 << len(actions) - 1
+        for action in reversed(actions):
+            if d_action & comp:
+                result = action
+                break
+            comp = comp >> 1
+    if d_configmask & SW_DATA_AIRWHEEL and d_sysinfo & 2:
+        result = d_airwheel[0]
+    return result
+
+
+def new_decode(frame):
+    # The same work done the way flicklib._handle_sensor_data does it now
+    (configmask, sysinfo, gesture, flags, action, count, airwheel, x, y, z) = flickframe.decode_sensor(frame)
+    result = None
+    if configmask & SW_DATA_XYZ and sysinfo & 1:
+        result = (x / 65536.0, y / 65536.0, z / 65536.0)
+    if configmask & SW_DATA_GESTURE and gesture and gesture < len(flickframe.GESTURES):
+        result = flickframe.GESTURES[gesture]
+    if configmask & SW_DATA_TOUCH and action:
+        result = flickframe.touch_action(action)
+    if configmask & SW_DATA_AIRWHEEL and sysinfo & 2:
+        result = airwheel
+    return result
+
+
+def make_frames(count):
+    frames = []
+    for _ in range(count):
+        gesture = random.choice([0] * 8 + [2, 3, 4, 5])
+        touch = random.choice([0] * 8 + [1 << random.randrange(15)])
+        frame = bytearray(flickframe.SENSOR_FRAME.pack(
+            0x1f, random.choice([0, 1, 3]), gesture, 1, touch, random.randrange(256),
+            random.randrange(256), random.randrange(65536), random.randrange(65536), random.randrange(65536)))
+        frame[0:4] = b'\x1a\x00\x01\x91'  # Header: size, flags, seq, ident
+        frames.append(frame)
+    return frames
+
+
+def measure(name, decode, frames):
+    start = time.perf_counter()
+    for frame in frames:
+        decode(frame)
+    rate = len(frames) / (time.perf_counter() - start)
+
+    tracemalloc.start()
+    transient = 0
+    for frame in frames[:2000]:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        decode(frame)
+        transient += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    print(f'{name:7} {rate:12,.0f} frames/s  {transient / min(len(frames), 2000):7.1f} bytes allocated/frame')
+    return rate
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    frames = make_frames(count)
+    for frame in frames[:1000]:
+        new = new_decode(frame)
+        if isinstance(new, tuple) and isinstance(new[0], int):
+            new = new[1:]  # Touch table entries carry their bit first
+        assert legacy_decode(frame) == new, frame
+    old = measure('legacy', legacy_decode, frames)
+    new = measure('struct', new_decode, frames)
+    print(f'speedup {new / old:.1f}x (the MGC3130 sends at most 200 frames/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import sys
+import json
+import argparse
+import statistics
+import sim
+
+# Runs flick.py against simulated hardware and a scripted timeline.
+# Usage: python flick-sim.py [--timeline steps.json] [--tracks N] [--irq] [--events out.json]
+#
+# A timeline file is a JSON list of [seconds, action, args...] steps, see
+# sim.py. Without one, a default script taps the three configured tags,
+# taps one twice more (the third tap in a row shuffles), swipes and flips
+# the switches. Prints the tap to audio latency of every tap, and exits 1
+# if the Bluetooth adapter does not end up following its switch.
+
+DEFAULT_TIMELINE = [
+    (1.0, 'tap', '1'),
+    (1.5, 'remove'),
+    (3.0, 'tap', '2'),
+    (3.5, 'remove'),
+    (4.5, 'flick', 'west', 'east'),
+    (5.5, 'flick', 'east', 'west'),
+    (6.5, 'tap', 'tag3'),
+    (7.0, 'remove'),
+    (9.5, 'tap', 'tag3'),   # Same tag again: album restarts in order
+    (10.0, 'remove'),
+    (12.5, 'tap', 'tag3'),  # Third tap in a row: shuffled album
+    (13.0, 'remove'),
+    (14.0, 'switch', 'bluetooth', False),
+    (14.2, 'bluetooth', True),  # bluetoothctl powers it on, flick.py turns it off again
+    (14.5, 'switch', 'nfc', False),
+    (15.5, 'switch', 'nfc', True),
+    (16.5, 'tap', 'unknown tag'),
+    (17.0, 'remove'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='flick.py on simulated hardware')
+    parser.add_argument('--timeline', help='JSON list of [seconds, action, args...]')
+    parser.add_argument('--tracks', type=int, default=120, help='size of the synthetic library')
+    parser.add_argument('--track-seconds', type=float, default=2.0)
+    parser.add_argument('--irq', action='store_true', help='wire up the PN532 IRQ line')
+    parser.add_argument('--events', help='write the recorded events to this JSON file')
+    args = parser.parse_args()
+
+    timeline = DEFAULT_TIMELINE
+    if args.timeline:
+        with open(args.timeline) as f:
+            timeline = [tuple(step) for step in json.load(f)]
+
+    simulation = sim.Simulation(tracks=args.tracks, track_seconds=args.track_seconds, irq=args.irq)
+    simulation.boot()
+    simulation.run(timeline, until=max(step[0] for step in timeline) + 1.0)
+
+    for at, kind, detail in simulation.events:
+        if kind in ('booted', 'tap', 'remove', 'switch', 'bluetooth', 'flick', 'play', 'stop', 'playing',
+                    'crashed'):
+            print(f'{at:8.3f}  {kind:8} {detail if detail is not None else ""}')
+    print()
+    latencies = []
+    for payload, latency in simulation.tap_latencies():
+        if latency is None:
+            print(f'tap {payload!r:14} no audio')
+        else:
+            latencies.append(latency * 1000)
+            print(f'tap {payload!r:14} audio after {latency * 1000:7.1f} ms')
+    if latencies:
+        print(f'tap to audio p50 {statistics.median(latencies):.1f} ms  max {max(latencies):.1f} ms')
+    print(f'bluetooth power changes: {simulation.adapter.sets}')
+    if args.events:
+        simulation.dump(args.events)
+    if simulation.adapter.powered != simulation.flick.switch_state.get('bluetooth'):
+        print('The Bluetooth adapter does not follow its switch')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import sys
+import time
+import types
+import statistics
+import threading
+import mockgpio
+import fakemgc3130
+import i2c
+
+# Mock-GPIO harness for the Flick poll thread.
+# Usage: python flick-xfer-bench.py [frames] [idle seconds]
+#
+# Imports the real flicklib on top of mockgpio and a fake MGC3130 on the
+# I2C bus, then compares the old spin-polling of the transfer line with
+# the edge-triggered wakeup: idle CPU, GPIO reads and I2C reads per
+# second while idle, and latency from a frame being ready to the flick
+# callback running.
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    idle = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    gpio = mockgpio.MockGPIO()
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = gpio
+    sys.modules['RPi'] = rpi
+    sys.modules['RPi.GPIO'] = gpio
+    fake = fakemgc3130.FakeMGC3130(gpio)
+    i2c.I2CMaster = lambda *args, **kwargs: fake
+    fake.firmware_ready()
+
+    import flicklib
+
+    flicked = []
+    seen = threading.Event()
+
+    @flicklib.flick()
+    def on_flick(start, finish):
+        flicked.append(time.monotonic())
+        seen.set()
+
+    for name, interrupt in (('spin poll', False), ('xfer edge', True)):
+        flicklib.xfer_interrupt = interrupt
+        time.sleep(0.3)
+
+        gpio_reads, i2c_reads = gpio.reads, fake.reads
+        cpu = time.process_time()
+        time.sleep(idle)
+        idle_cpu = (time.process_time() - cpu) / idle * 100
+        gpio_rate = (gpio.reads - gpio_reads) / idle
+        i2c_rate = (fake.reads - i2c_reads) / idle
+
+        latencies = []
+        i2c_reads = fake.reads
+        for _ in range(frames):
+            seen.clear()
+            sent = time.monotonic()
+            fake.flick('west', 'east')
+            if seen.wait(1):
+                latencies.append((flicked[-1] - sent) * 1000)
+            time.sleep(0.02)
+        reads_per_frame = (fake.reads - i2c_reads) / frames
+
+        print(f'{name:10} idle CPU {idle_cpu:5.1f} %  idle GPIO reads {gpio_rate:7.0f}/s  '
+              f'idle I2C reads {i2c_rate:6.1f}/s  latency p50 {statistics.median(latencies):5.2f} ms '
+              f'max {max(latencies):5.2f} ms  I2C reads/frame {reads_per_frame:.2f}')
+
+    flicklib._stop_poll()
+
+
+if __name__ == '__main__':
+    main()
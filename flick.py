@@ -1,21 +1,37 @@
-import time
 import json
 import vlc
 import os
 import board
 import busio
 import RPi.GPIO as GPIO
-import subprocess
 from adafruit_pn532.i2c import PN532_I2C
 import logging
 import threading
 import random
+import queue
 import flicklib
+import library
+import watcher
+import playlists
+import tagevents
+import nfcdetect
+import btpower
+import switches
+import history as play_history
+import playqueue
+import ntag
+import tagindex
+import tagwriter
+import nfcd
+import prefetch
+import flacmeta
+import metrics
+import logpipe
+import transition
 
 last_scanned_tag = None
 consecutive_scans = 0
-scan_delay = 2  # Delay in seconds after a tag is scanned
-current_song_index = -1
+scan_delay = 2  # Seconds a tag must be away from the reader before it counts as a new tap
 skip_back_count = 0
 default_play_random = False
 
@@ -23,33 +39,122 @@ default_play_random = False
 switch_pin_1 = 25  # GPIO 25 for Bluetooth
 switch_pin_2 = 24  # GPIO 24 for NFC tag scanning control
 
-# Set up GPIO
+# Set up GPIO, the switches are edge-triggered and debounced
 GPIO.setmode(GPIO.BCM)
-GPIO.setup(switch_pin_1, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-GPIO.setup(switch_pin_2, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+switch_state = switches.Switches(GPIO, {'bluetooth': switch_pin_1, 'nfc': switch_pin_2})
 
 # Load configuration
-with open('config.json', 'r') as config_file:
+config_path = 'config.json'
+with open(config_path, 'r') as config_file:
     config = json.load(config_file)
+config_mtime = os.stat(config_path).st_mtime
 
 audio_folder = config['global_config']['audio_folder']
+library_db = os.path.join(os.path.dirname(os.path.abspath(config_path)), 'library.db')
+metadata_db = os.path.join(os.path.dirname(os.path.abspath(config_path)), 'metadata.db')
 
-# Logging
-logging.basicConfig(filename='app.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Logging, written to app.log by a background thread so no caller waits on the SD card
+log_pipeline = logpipe.start('app.log', config['global_config'])
 
 logging.info('Program started')
 
+# Load the library index, only directories changed since the last run are rescanned
+music_library = library.open_library(audio_folder, library_db)
+music_library.all_track_ids()  # Warm the track ID cache the shuffle draws from
+logging.info(f'Library index loaded: {len(music_library)} tracks')
+
 # Create a VLC instance with ALSA audio output
 vlc_instance = vlc.Instance('--aout=alsa')
 
-# Use this instance to create the media player
-player = vlc_instance.media_list_player_new()
+# Two media list players behind one, a new tag crossfades from the old album
+player = transition.Crossfader(vlc_instance, config['global_config'].get('crossfade_seconds', transition.CROSSFADE))
+
+# libvlc calls back on its own thread, where calling back into libvlc is not
+# allowed, so player events are only queued here and handled by the main loop.
+# MediaListPlayerPlayed fires when the last item of the list has finished,
+# MediaListPlayerStopped only follows our own player.stop() calls.
+main_events = queue.Queue()
+NFC_SWITCHED_OFF = 'nfc-off'
+TRACK_GAP = 'track-gap'
+
+def on_player_event(event):
+    main_events.put(event.type)
+
+player.event_manager().event_attach(vlc.EventType.MediaListPlayerPlayed, on_player_event)
+player.event_manager().event_attach(vlc.EventType.MediaListPlayerNextItemSet, on_player_event)
+
+# Time from one track ending to the next one playing, these callbacks only
+# take timestamps on libvlc's thread, the main loop logs the gap
+gap_meter = prefetch.GapMeter()
+
+def on_track_end(event):
+    gap_meter.track_ended()
+
+def on_track_playing(event):
+    if gap_meter.track_started() is not None:
+        main_events.put(TRACK_GAP)
+
+media_player = player.get_media_player()
+media_player.event_manager().event_attach(vlc.EventType.MediaPlayerEndReached, on_track_end)
+media_player.event_manager().event_attach(vlc.EventType.MediaPlayerPlaying, on_track_playing)
+
+# Warms the next track in the page cache while the current one plays
+prefetcher = prefetch.Prefetcher()
+current_media_list = None
+
+def new_media(path):
+    media = vlc_instance.media_new(path)
+    media.parse_with_options(vlc.MediaParseFlag.local, 0)  # Parses in the background
+    return media
+
+# Track and disc numbers from the FLAC headers, parsed once per file version
+track_metadata = flacmeta.open_cache(metadata_db)
+
+# Resolve every configured tag to its track list (in album order) and media up front
+tag_playlists = playlists.TagPlaylists(music_library, audio_folder, media_factory=new_media,
+                                       order=track_metadata.order)
+tag_playlists.resolve_all(config['tags'])
+
+# Apply new, removed and renamed files (e.g. from rsync) to the index in the background
+def on_library_change():
+    tag_playlists.resolve_all()
+    music_library.all_track_ids()  # Rebuild the shuffle order cache off the playback path
+
+library_watcher = watcher.watch_library(music_library, on_change=on_library_change)
 
 # Initialize NFC reader
 i2c = busio.I2C(board.SCL, board.SDA)
 pn532 = PN532_I2C(i2c, debug=False)
 pn532.SAM_configuration()
 
+# Reads whole tag payloads in as few transactions as possible, cached by UID
+tag_reader = ntag.TagReader(pn532)
+
+# Tag keys learned by UID, known tags resolve without reading tag memory
+uid_index = tagindex.open_index(config_path)
+
+def config_uid_keys(tags):
+    # config.json may use a raw UID (e.g. "04A1B2C3D4E580") as a tag key
+    return {tagindex.uid_hex(key): key for key in tags if tagindex.is_uid(key)}
+
+config_uids = config_uid_keys(config['tags'])
+
+# Wait for tags on the PN532 IRQ line if it is wired up, otherwise poll with backoff
+tag_detector = nfcdetect.open_detector(pn532, GPIO, config['global_config'].get('pn532_irq_pin'))
+
+# The player owns the reader, server.py and the other tag writers use it
+# through nfcd's socket so they never touch the I2C bus themselves
+tag_writer = tagwriter.TagWriter(pn532, reader=tag_reader, index=uid_index)
+nfc_service = nfcd.NfcService(pn532, tag_reader, tag_writer, detector=tag_detector)
+nfc_server = nfcd.serve(nfc_service, config['global_config'].get('nfcd_socket', nfcd.SOCKET_PATH))
+
+# Hot path timings on http://127.0.0.1:9105/metrics (Prometheus text format)
+metrics_server = metrics.serve(config['global_config'].get('metrics_port', 9105))
+metrics.gauge('flick_library_tracks', 'FLAC files in the library index', lambda: len(music_library))
+metrics.gauge('flick_inter_track_gap_mean_seconds', 'Mean gap between album tracks', lambda: gap_meter.mean)
+metrics.gauge('flick_flick_io_errors', 'Consecutive Flick board I2C errors', lambda: flicklib.io_error_count)
+metrics.gauge('flick_log_dropped_records', 'Log records dropped on a full log queue', lambda: log_pipeline.handler.dropped)
+
 @flicklib.flick()
 def flick(start, finish):
     if start == 'north' and finish == 'south':
@@ -65,71 +170,85 @@ def flick(start, finish):
         # Play the previous song if flicked from right to left
         play_previous_song()
 
-# Add a history array to log file locations
-history = []
-current_song_index = -1
-
-def find_flac_files(directory):
-    flac_files = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.flac'):
-                flac_files.append(os.path.join(root, file))
-    return flac_files
-
-def play_all_songs_randomly():
-    global history, current_song_index
+# Play history as library track IDs in a fixed-size ring buffer,
+# history.cursor is the position of the current song
+history = play_history.PlayHistory(capacity=4096)
+
+# Whole-library shuffle only keeps the next few tracks in VLC's media list
+shuffle_queue = playqueue.ShuffleQueue(music_library, new_media, window=5, on_track=history.append)
+
+def set_media_list(media_list, crossfade=False):
+    global current_media_list
+    current_media_list = media_list
+    player.set_media_list(media_list, crossfade)  # With crossfade, the next play() fades over to it
+
+def prefetch_next_track():
+    # Called on NextItemSet from the main loop, where calling libvlc is allowed
+    if current_media_list is None:
+        return
+    media = media_player.get_media()
+    if media is None:
+        return
+    index = current_media_list.index_of_item(media)
+    if index < 0 or index + 1 >= current_media_list.count():
+        return
+    next_media = current_media_list.item_at_index(index + 1)
+    prefetcher.warm(prefetch.mrl_path(next_media.get_mrl()))
+    if next_media.get_parsed_status() != vlc.MediaParsedStatus.done:
+        next_media.parse_with_options(vlc.MediaParseFlag.local, 0)
+
+def continue_shuffle():
+    # The shuffle's media list has played out, the next tracks go in a fresh one
+    media_list = vlc_instance.media_list_new()
+    shuffle_queue.next_list(media_list)
+    set_media_list(media_list)
+    player.play()
+    logging.debug('Shuffle continues in a new media list')
+
+def play_all_songs_randomly(crossfade=False):
     try:
         media_list = vlc_instance.media_list_new()
-        flac_files = find_flac_files(audio_folder)
-        random.shuffle(flac_files)
-        for flac_file in flac_files:
-            media_list.add_media(vlc_instance.media_new(flac_file))
-            history.append(flac_file)
-        player.set_media_list(media_list)
-        current_song_index = -1  # Reset current song index
+        shuffle_queue.start(media_list)  # Adds the first tracks to history too
+        set_media_list(media_list, crossfade)
+        history.cursor = -1  # Reset current song index
         player.play()
         logging.info(f"Started playing all songs randomly")
     except Exception as e:
         logging.error(f'Error playing all songs randomly: {e}')
 
-def play_album(folder, shuffle=False):
+@metrics.timed('flick_play_album_seconds', 'play_album, media list built and play() called')
+def play_album(folder, shuffle=False, playlist=None, crossfade=False):
     try:
-        media_list = vlc_instance.media_list_new()
-        album_path = os.path.join(audio_folder, folder)
-        flac_files = find_flac_files(album_path)
+        shuffle_queue.stop()
+        if playlist is None:
+            playlist = tag_playlists.resolve_folder(folder)
+        media = list(playlist.media)
         if shuffle:
-            random.shuffle(flac_files)
-        for flac_file in flac_files:
-            media_list.add_media(vlc_instance.media_new(flac_file))
-        player.set_media_list(media_list)
+            random.shuffle(media)
+        media_list = vlc_instance.media_list_new()
+        for m in media:
+            media_list.add_media(m)
+        set_media_list(media_list, crossfade)
         player.play()
         logging.info(f"Started playing album: {folder} {'shuffled' if shuffle else 'in order'}")
     except Exception as e:
         logging.error(f'Error playing album {folder}: {e}')
 
 def play_next_song():
-    global current_song_index
-    if current_song_index < len(history) - 1:
-        current_song_index += 1
-    else:
-        current_song_index = 0
+    history.step(1)  # Wraps around to the oldest song
     play_specific_song()
 
 def play_previous_song():
-    global current_song_index, skip_back_count, default_play_random
+    global skip_back_count, default_play_random
     if default_play_random:
-        if current_song_index > 0:
-            current_song_index -= 1
+        if history.cursor > 0:
             skip_back_count += 1
-            play_specific_song()
-        else:
-            current_song_index = len(history) - 1
-            play_specific_song()
+        history.step(-1)  # Wraps around to the newest song
+        play_specific_song()
     else:
         # If in the process of skipping back, play two songs after the skipped song
-        if 0 <= current_song_index < len(history) and skip_back_count > 0:
-            current_song_index = (current_song_index + 2) % len(history)
+        if history.current() is not None and skip_back_count > 0:
+            history.step(2)
             skip_back_count = 0
             play_specific_song()
         else:
@@ -138,14 +257,16 @@ def play_previous_song():
             play_all_songs_randomly()
 
 def play_specific_song():
-    global current_song_index
-    if 0 <= current_song_index < len(history):
+    track_id = history.current()
+    if track_id is not None:
+        path = music_library.track_path(track_id)
+        shuffle_queue.stop()
         player.stop()
         media_list = vlc_instance.media_list_new()
-        media_list.add_media(vlc_instance.media_new(history[current_song_index]))
-        player.set_media_list(media_list)
+        media_list.add_media(vlc_instance.media_new(path))
+        set_media_list(media_list)
         player.play()
-        logging.info(f"Playing specific song: {history[current_song_index]}")
+        logging.info(f"Playing specific song: {path}")
 
 #def play_album(folder, shuffle=False):
 #    try:
@@ -163,9 +284,36 @@ def play_specific_song():
 #    except Exception as e:
 #        logging.error(f'Error playing album {folder}: {e}')
 
+def reload_config_if_changed():
+    global config, config_mtime, config_uids
+    try:
+        mtime = os.stat(config_path).st_mtime
+        if mtime == config_mtime:
+            return
+        with open(config_path, 'r') as config_file:
+            config = json.load(config_file)
+        config_mtime = mtime
+        config_uids = config_uid_keys(config['tags'])
+        tag_playlists.resolve_all(config['tags'])
+        player.crossfade = config['global_config'].get('crossfade_seconds', transition.CROSSFADE)
+        log_pipeline.set_level(logpipe.level_for(config['global_config'].get('enable_logging', False)))
+        logging.info('Configuration reloaded')
+    except Exception as e:
+        logging.error(f'Error reloading configuration: {e}')
+
+def config_tag_key(tag_data):
+    # Only the first four characters of a tag used to be read, so
+    # config.json may still have the shortened key for a longer payload
+    if tag_data not in config['tags'] and tag_data[:4] in config['tags']:
+        return tag_data[:4]
+    return tag_data
+
+@metrics.timed('flick_handle_new_tag_seconds', 'handle_new_tag, tag key to playback started')
 def handle_new_tag(tag_data):
     global last_scanned_tag, consecutive_scans
     shuffle = False
+    reload_config_if_changed()
+    tag_data = config_tag_key(tag_data)
 
     if tag_data == last_scanned_tag:
         consecutive_scans += 1
@@ -173,106 +321,136 @@ def handle_new_tag(tag_data):
             shuffle = True
         else:
             consecutive_scans = 1
-    else:
-        play_all_songs_randomly()
-
-    if player.is_playing():
-        player.stop()
 
+    # No stop first, whatever is playing fades out under the new list
     if tag_data in config['tags']:
-        play_album(config['tags'][tag_data]['folder'], shuffle)
+        play_album(config['tags'][tag_data]['folder'], shuffle, tag_playlists.get(tag_data), crossfade=True)
     else:
-        play_all_songs_randomly()
+        play_all_songs_randomly(crossfade=True)
 
     last_scanned_tag = tag_data  # Update the last scanned tag
-    time.sleep(scan_delay)  # Delay to prevent immediate re-scanning
+
+scan_tag_time = metrics.histogram('flick_scan_tag_seconds', 'scan_tag from UID to tag key')
 
 def scan_tag():
     try:
-        uid = pn532.read_passive_target(timeout=0.5)
+        # Short waits, so queued requests from the tag writers get the reader
+        # in between. An armed IRQ detector costs nothing while it waits.
+        uid = nfc_service.call(tag_detector.wait_for_tag, 0.25, priority=nfcd.PLAYBACK)
         if uid is not None:
-            data_read = pn532.ntag2xx_read_block(4)
-            tag_data = data_read.decode('utf-8').strip()
-            tag_data = tag_data.replace('\x00', '').strip()
-            logging.info(f'Tag scanned: {tag_data}')
-            return tag_data
+            if not tag_debouncer.accept(bytes(uid)):
+                return None  # Same tag still on the reader, skip reading it again
+            # Timed from a new tap's UID on, waiting for a tag is idle time
+            with scan_tag_time.time():
+                # Raw UID keys and learned tags need no tag memory read
+                tag_data = config_uids.get(tagindex.uid_hex(uid))
+                if tag_data is None:
+                    tag_data = uid_index.get(uid)
+                if tag_data is None:
+                    # Full payload (plain text or NDEF)
+                    tag_data = nfc_service.call(tag_reader.read_payload, uid, priority=nfcd.PLAYBACK)
+                    if tag_data is None:
+                        tag_debouncer.forget(bytes(uid))  # Try again on the next poll
+                        return None
+                    uid_index.learn(uid, tag_data)
+                logging.info(f'Tag scanned: {tag_data}')
+                return tag_data
         else:
             logging.debug('No tag found')
     except Exception as e:
         logging.error(f'Error reading tag: {e}')
     return None
 
-def check_bluetooth_state():
-    result = subprocess.run(['bluetoothctl', 'show'], capture_output=True, text=True)
-    return 'Powered: yes' in result.stdout
+# Adapter power state is cached and kept current from BlueZ signals
+bluetooth_service = btpower.BluetoothService()
 
+@metrics.timed('flick_set_bluetooth_power_seconds', 'set_bluetooth_power')
 def set_bluetooth_power(state):
-    if state:
-        subprocess.run(['bluetoothctl', 'power', 'on'])
-    else:
-        subprocess.run(['bluetoothctl', 'power', 'off'])
+    bluetooth_service.set_power(state)
 
 def tag_scanning_loop():
     while True:
-        # Check if NFC tag scanning is allowed (based on switch_pin_2 state)
-        switch_2_state = GPIO.input(switch_pin_2)
-        if switch_2_state == GPIO.LOW:
-            time.sleep(1)  # Add a delay to avoid rapid checking when the switch is off
-            continue  # Skip NFC tag scanning and handling
+        # Sleep while NFC tag scanning is switched off (switch_pin_2)
+        switch_state.wait_for('nfc', True)
 
         tag_data = scan_tag()
         if tag_data:
+            tag_events.put(tag_data)  # Never wait on VLC here, the worker plays it
+
+def playback_worker():
+    while True:
+        tag_data = tag_events.get()
+        # Only the most recent tap matters if several queued up while VLC was busy
+        while not tag_events.empty():
+            tag_data = tag_events.get_nowait()
+        try:
             handle_new_tag(tag_data)
-        time.sleep(0.1)
+        except Exception as e:
+            logging.error(f'Error handling tag {tag_data}: {e}')
+
+tag_debouncer = tagevents.TagDebouncer(hold_time=scan_delay)
+tag_events = queue.Queue()
+
+# Start the playback worker and the tag scanning in separate threads
+playback_thread = threading.Thread(target=playback_worker)
+playback_thread.daemon = True
+playback_thread.start()
 
-# Start the tag scanning in a separate thread
 tag_scanning_thread = threading.Thread(target=tag_scanning_loop)
 tag_scanning_thread.daemon = True
 tag_scanning_thread.start()
 
-try:
-    # Check initial switch states and set Bluetooth accordingly
-    initial_switch_1_state = GPIO.input(switch_pin_1)
-    initial_switch_2_state = GPIO.input(switch_pin_2)
-    initial_bluetooth_state = check_bluetooth_state()
+def on_nfc_switch(state):
+    if not state:
+        main_events.put(NFC_SWITCHED_OFF)
 
-    if initial_switch_1_state == GPIO.LOW and initial_bluetooth_state:
-        set_bluetooth_power(False)
-    elif initial_switch_1_state == GPIO.HIGH and not initial_bluetooth_state:
-        set_bluetooth_power(True)
+# Bluetooth follows switch_pin_1, NFC scanning follows switch_pin_2
+switch_state.add_listener('bluetooth', set_bluetooth_power)
+switch_state.add_listener('nfc', on_nfc_switch)
+
+def on_bluetooth_power(powered):
+    # Something else switched the adapter (bluetoothctl, a BlueZ restart),
+    # put it back to what switch_pin_1 says
+    wanted = switch_state.get('bluetooth')
+    if powered != wanted:
+        logging.info(f"Bluetooth switched {'on' if powered else 'off'} elsewhere, following the switch")
+        set_bluetooth_power(wanted)
+
+bluetooth_service.add_listener(on_bluetooth_power)
+
+try:
+    # Set Bluetooth according to the initial switch state
+    set_bluetooth_power(switch_state.get('bluetooth'))
 
     while True:
-        print("history\n", history)
-        flac_files = []
-        print("flac_files\n\n\n", flac_files)
-        time.sleep(1)
-        # Check if the player has finished playing the current item
-        if not player.is_playing() and last_scanned_tag is not None:
-            play_all_songs_randomly()  # Play all songs randomly after an album is done
+        # Nothing to do until VLC reports the end of the list or a switch flips
+        event = main_events.get()
+        if event == vlc.EventType.MediaListPlayerPlayed and shuffle_queue.is_played_out():
+            continue_shuffle()
 
-        # Check the state of the external switches
-        switch_1_state = GPIO.input(switch_pin_1)
-        switch_2_state = GPIO.input(switch_pin_2)
-        bluetooth_state = check_bluetooth_state()
+        elif event == vlc.EventType.MediaListPlayerPlayed and last_scanned_tag is not None:
+            play_all_songs_randomly()  # Play all songs randomly after an album is done
 
-        if switch_1_state == GPIO.LOW and bluetooth_state:
-            # Switch 1 is off and Bluetooth is on, turn off Bluetooth
-            set_bluetooth_power(False)
-            time.sleep(1)  # Add a delay to avoid rapid switching
+        elif event == vlc.EventType.MediaListPlayerNextItemSet:
+            shuffle_queue.next_item()  # Keep the shuffle window topped up
+            prefetch_next_track()
 
-        elif switch_1_state == GPIO.HIGH and not bluetooth_state:
-            # Switch 1 is on and Bluetooth is off, turn on Bluetooth
-            set_bluetooth_power(True)
-            time.sleep(1)  # Add a delay to avoid rapid switching
+        elif event == TRACK_GAP:
+            logging.info(f'Inter-track gap {gap_meter.last * 1000:.0f} ms ({gap_meter})')
 
-        # Check if NFC tag scanning is allowed (based on switch_2_state)
-        if switch_2_state == GPIO.LOW:
+        elif event == NFC_SWITCHED_OFF:
             player.stop()  # Stop player activity when switch 2 is off
+            gap_meter.reset()
             last_scanned_tag = None  # Reset last scanned tag
-            continue  # Skip NFC tag scanning and handling
 
 except KeyboardInterrupt:
     print("Program terminated by user")
 finally:
+    nfc_server.server_close()
+    nfc_service.close()
+    prefetcher.close()
+    player.close()
+    switch_state.close()
+    log_pipeline.close()
     i2c.deinit()
     GPIO.cleanup()  # Clean up GPIO resources
@@ -0,0 +1,70 @@
+import struct
+
+# MGC3130 sensor data frame decoding for flicklib.
+#
+# Kept free of any hardware imports so it can be used (and benchmarked)
+# off the Pi. A sensor data frame is the 4 byte message header followed
+# by the fields below, all little endian:
+#
+#   configmask H, timestamp B, sysinfo B, dsp status H,
+#   gesture info 4B, touch info H + 2B, airwheel 2B, x y z 3H
+
+# Only the fields flicklib uses are unpacked, the rest are pad bytes:
+# configmask, sysinfo, gesture, gesture flags, touch action, touch count,
+# airwheel, x, y, z
+SENSOR_FRAME = struct.Struct('<4xHxB2xB2xBHBxBx3H')
+SENSOR_FRAME_SIZE = SENSOR_FRAME.size  # 26 bytes
+
+# Gesture ID (1 based) -> (kind, start, finish)
+GESTURES = (
+    None,
+    ('garbage', '', ''),
+    ('flick', 'west', 'east'),
+    ('flick', 'east', 'west'),
+    ('flick', 'south', 'north'),
+    ('flick', 'north', 'south'),
+    ('circle', 'clockwise', ''),
+    ('circle', 'counter-clockwise', ''),
+)
+
+_TOUCH_ACTIONS = (
+    ('touch', 'south'),
+    ('touch', 'west'),
+    ('touch', 'north'),
+    ('touch', 'east'),
+    ('touch', 'center'),
+    ('tap', 'south'),
+    ('tap', 'west'),
+    ('tap', 'north'),
+    ('tap', 'east'),
+    ('tap', 'center'),
+    ('doubletap', 'south'),
+    ('doubletap', 'west'),
+    ('doubletap', 'north'),
+    ('doubletap', 'east'),
+    ('doubletap', 'center'),
+)
+
+# (bit, kind, position), highest bit first: only the highest set bit counts
+TOUCH_ACTIONS = tuple((1 << i, kind, position)
+                      for i, (kind, position) in reversed(list(enumerate(_TOUCH_ACTIONS))))
+TOUCH_MASK = (1 << len(_TOUCH_ACTIONS)) - 1
+
+
+def decode_sensor(frame):
+    """Unpack a sensor data frame (bytes, bytearray or memoryview) in place
+
+    Returns (configmask, sysinfo, gesture, gesture_flags, touch_action,
+    touch_count, airwheel, x, y, z) as plain ints.
+    """
+    return SENSOR_FRAME.unpack_from(frame)
+
+
+def touch_action(bits):
+    """The (bit, kind, position) entry for the highest touch bit set, or None"""
+    if not bits & TOUCH_MASK:
+        return None
+    for action in TOUCH_ACTIONS:
+        if bits & action[0]:
+            return action
+    return None
@@ -1,9 +1,12 @@
 import atexit
 import threading
 import time
+import logging
 from sys import exit, version_info
 import sys
 import i2c
+import flickframe
+import metrics
 
 try:
     import RPi.GPIO as GPIO
@@ -53,6 +56,11 @@ gesture = 0
 
 io_error_count = 0
 
+# Sleep on a falling edge of the transfer line between frames instead of
+# spin-polling it. Set to False to go back to polling.
+xfer_interrupt = True
+xfer_timeout = 0.1
+
 _worker = None
 _on_flick = None
 _on_move = None
@@ -75,7 +83,12 @@ fw_info = { 'FwValid'          : '',
 def i2c_write(data):
     i2cm.transaction(i2c.writing_bytes(SW_ADDR, *data))
 
+# Sensor frames are read hundreds of times a second, reuse one buffer for them
+_frame_read = i2cm.prepare_read(SW_ADDR, flickframe.SENSOR_FRAME_SIZE)
+
 def i2c_read(len):
+    if len == flickframe.SENSOR_FRAME_SIZE:
+        return _frame_read()
     data = i2cm.transaction(i2c.reading(SW_ADDR, len))
     return data[0]
 
@@ -131,117 +144,35 @@ class AsyncWorker(StoppableThread):
                 self.stop_event.set()
                 break
 
-def _handle_sensor_data(data):
+def _handle_sensor_data(frame):
     global _lastrotation, rotation
 
-    d_configmask = data.pop(0) | data.pop(0) << 8
-    d_timestamp = data.pop(0) # 200hz, 8-bit counter, max ~1.25sec
-    d_sysinfo = data.pop(0)
-
-    d_dspstatus = data[0:2]
-    d_gesture = data[2:6]
-    d_touch = data[6:10]
-    d_airwheel = data[10:12]
-    d_xyz = data[12:20]
-    d_noisepow = data[20:24]
+    # One struct unpack straight from the I2C buffer, no per-field slices
+    (d_configmask, d_sysinfo, d_gesture, d_gestureflags, d_action,
+     d_touchcount, d_airwheel, d_x, d_y, d_z) = flickframe.decode_sensor(frame)
 
     if d_configmask & SW_DATA_XYZ and d_sysinfo & 0b0000001:
         # We have xyz info, and it's valid
-        x, y, z = (
-            (d_xyz[1] << 8 | d_xyz[0]) / 65536.0,
-            (d_xyz[3] << 8 | d_xyz[2]) / 65536.0,
-            (d_xyz[5] << 8 | d_xyz[4]) / 65536.0
-        )
         if callable(_on_move):
-            _on_move(x, y, z)
+            _on_move(d_x / 65536.0, d_y / 65536.0, d_z / 65536.0)
 
-    if d_configmask & SW_DATA_GESTURE and not d_gesture[0] == 0:
+    if d_configmask & SW_DATA_GESTURE and not d_gesture == 0:
         # We have a gesture!
-        is_edge = (d_gesture[3] & 0b00000001) > 0
-        gestures = [
-            ('garbage','',''),
-            ('flick','west','east'),
-            ('flick','east','west'),
-            ('flick','south','north'),
-            ('flick','north','south'),
-            ('circle','clockwise',''),
-            ('circle','counter-clockwise','')
-        ]
-        for i,gesture in enumerate(gestures):
-            if d_gesture[0] == i + 1:
-
-                if gesture[0] == 'flick' and callable(_on_flick):
-                    _on_flick(gesture[1], gesture[2])
+        is_edge = (d_gestureflags & 0b00000001) > 0
+        if d_gesture < len(flickframe.GESTURES):
+            gesture = flickframe.GESTURES[d_gesture]
+            if gesture[0] == 'flick' and callable(_on_flick):
+                _on_flick(gesture[1], gesture[2])
 
-                break
-
-    if d_configmask & SW_DATA_TOUCH and not (d_touch[0] == 0 and d_touch[1] == 0):
+    if d_configmask & SW_DATA_TOUCH and d_action:
         # We have a touch
-        d_action = d_touch[1] << 8 | d_touch[0]
-        d_touchcount = d_touch[2] * 5 # Time to touch in ms
-
-        actions = [
-            ('touch','south'),
-            ('touch','west'),
-            ('touch','north'),
-            ('touch','east'),
-            ('touch','center'),
-            ('tap','south'),
-            ('tap','west'),
-            ('tap','north'),
-            ('tap','east'),
-            ('tap','center'),
-            ('doubletap','south'),
-            ('doubletap','west'),
-            ('doubletap','north'),
-            ('doubletap','east'),
-            ('doubletap','center')
-        ]
-
-        comp = 0b0000000000000001 << len(actions)-1
-        for action in reversed(actions):
-            if d_action & comp:
-
-                handle_touch = False
-
-                if action[0] in _on_touch.keys() and action[1] in _on_touch[action[0]].keys():
-                    if not action[0] in _on_touch_last.keys():
-                        _on_touch_last[action[0]] = {}
-                        handle_touch = True
-
-                    if not action[1] in _on_touch_last[action[0]].keys():
-                        _on_touch_last[action[0]][action[1]] = None
-                        handle_touch = True
-
-                    elif (millis() - _on_touch_last[action[0]][action[1]]) >= 1000.0 / _on_touch_repeat[action[0]][action[1]]:
-                        handle_touch = True
-
-                    if callable(_on_touch[action[0]][action[1]]) and handle_touch:
-                        _on_touch[action[0]][action[1]](action[1])
-                        _on_touch_last[action[0]][action[1]] = millis()
-
-                if action[0] in _on_touch.keys() and 'all' in _on_touch[action[0]].keys():
-                    if not action[0] in _on_touch_last.keys():
-                        _on_touch_last[action[0]] = {}
-                        handle_touch = True
-
-                    if not 'all' in _on_touch_last[action[0]].keys():
-                        _on_touch_last[action[0]]['all'] = None
-                        handle_touch = True
-
-                    elif (millis() - _on_touch_last[action[0]]['all']) >= 1000.0 / _on_touch_repeat[action[0]]['all']:
-                        handle_touch = True
-
-                    if callable(_on_touch[action[0]]['all']) and handle_touch:
-                        _on_touch[action[0]]['all'](action[1])
-                        _on_touch_last[action[0]]['all'] = millis()
-
-                break
-            comp = comp >> 1
+        action = flickframe.touch_action(d_action)
+        if action is not None:
+            _handle_touch(action[1], action[2])
 
     if d_configmask & SW_DATA_AIRWHEEL and d_sysinfo & 0b00000010:
         # Airwheel
-        delta = (d_airwheel[0] - _lastrotation) / 32.0
+        delta = (d_airwheel - _lastrotation) / 32.0
 
         # Delta is in degrees, with 1 = full 360 degree rotation
         # Positive numbers equal clockwise delta, negative are counter-clockwise
@@ -258,7 +189,42 @@ def _handle_sensor_data(data):
             if rotation > 1000:
                 rotation = 1000
 
-        _lastrotation = d_airwheel[0]
+        _lastrotation = d_airwheel
+
+def _handle_touch(kind, position):
+    handle_touch = False
+
+    if kind in _on_touch.keys() and position in _on_touch[kind].keys():
+        if not kind in _on_touch_last.keys():
+            _on_touch_last[kind] = {}
+            handle_touch = True
+
+        if not position in _on_touch_last[kind].keys():
+            _on_touch_last[kind][position] = None
+            handle_touch = True
+
+        elif (millis() - _on_touch_last[kind][position]) >= 1000.0 / _on_touch_repeat[kind][position]:
+            handle_touch = True
+
+        if callable(_on_touch[kind][position]) and handle_touch:
+            _on_touch[kind][position](position)
+            _on_touch_last[kind][position] = millis()
+
+    if kind in _on_touch.keys() and 'all' in _on_touch[kind].keys():
+        if not kind in _on_touch_last.keys():
+            _on_touch_last[kind] = {}
+            handle_touch = True
+
+        if not 'all' in _on_touch_last[kind].keys():
+            _on_touch_last[kind]['all'] = None
+            handle_touch = True
+
+        elif (millis() - _on_touch_last[kind]['all']) >= 1000.0 / _on_touch_repeat[kind]['all']:
+            handle_touch = True
+
+        if callable(_on_touch[kind]['all']) and handle_touch:
+            _on_touch[kind]['all'](position)
+            _on_touch_last[kind]['all'] = millis()
 
 def _handle_status_info(data):
     error = data[7] << 8 | data[6]
@@ -282,6 +248,7 @@ def _handle_firmware_info(data):
         raise Exception("An invalid GestiIC Library was stored, or the last update failed")
 
 def _read_msg(len=132):
+    global io_error_count
     end = time.time() + 0.005
     while GPIO.input(SW_XFER_PIN) and time.time() < end:
         time.sleep(0.001)
@@ -295,6 +262,8 @@ def _read_msg(len=132):
         try:
             data = i2c_read(len)
             io_error_count = 0
+            if isinstance(data, memoryview):
+                return data  # Prepared frame buffer, valid until the next read
             return bytearray(data)
         except IOError:
             io_error_count += 1
@@ -304,24 +273,47 @@ def _read_msg(len=132):
         finally:
             GPIO.setup(SW_XFER_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
+def _wait_for_xfer(timeout):
+    '''Sleep until the MGC3130 pulls the transfer line low
+
+    Returns True if a message is waiting. The line stays low until we
+    read, so an edge missed just before waiting is caught by the level
+    check after the timeout.
+    '''
+    global xfer_interrupt
+    if not GPIO.input(SW_XFER_PIN):
+        return True
+    try:
+        GPIO.wait_for_edge(SW_XFER_PIN, GPIO.FALLING, timeout=int(timeout * 1000))
+    except (RuntimeError, TypeError) as e:
+        # RPi.GPIO too old for edge timeouts, fall back to polling
+        logging.warning(f'Flick: no XFER edge detection ({e}), polling instead')
+        xfer_interrupt = False
+    return not GPIO.input(SW_XFER_PIN)
+
+_poll_time = metrics.histogram('flick_poll_seconds', 'Flick frame read and dispatch, idle polls not counted')
+
 def _do_poll():
     #time.sleep(0.004)
-    data = _read_msg(26)
+    if xfer_interrupt and not _wait_for_xfer(xfer_timeout):
+        # No msg from MGC3130
+        return
+    start = time.perf_counter()
+    data = _read_msg(flickframe.SENSOR_FRAME_SIZE)
 
-    d_size  = data.pop(0)
-    if d_size == 0:
+    # Header: size, flags, seq, ident. Read by index, the frame is not copied
+    if data[0] == 0:
         # No msg from MGC3130
         return
-    d_flags = data.pop(0)
-    d_seq   = data.pop(0)
-    d_ident = data.pop(0)
+    d_ident = data[3]
 
-    if d_ident == 0x91:
+    if d_ident == SW_SENSOR_DATA and len(data) >= flickframe.SENSOR_FRAME_SIZE:
         _handle_sensor_data(data)
-    elif d_ident == 0x15:
-        _handle_status_info(data)
+    elif d_ident == SW_SYSTEM_STATUS:
+        _handle_status_info(data[4:])
     else:
         pass
+    _poll_time.observe(time.perf_counter() - start)
 
 def _start_poll():
     global _worker
@@ -0,0 +1,68 @@
+import os
+import sys
+import random
+import subprocess
+import history
+
+# RSS after many album-end fallbacks, old history list vs PlayHistory.
+# Usage: python history-bench.py [fallbacks] [library tracks]
+#
+# Each fallback appends the whole shuffled library to the history, like
+# play_all_songs_randomly() does. Every mode runs in a fresh interpreter
+# so the numbers don't mix.
+
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def make_paths(tracks):
+    return [f'/home/toshiba/Music/Artist {n // 48:04d}/Album {n // 12:05d}/{n % 12 + 1:02d} Track.flac'
+            for n in range(tracks)]
+
+
+def run(mode, fallbacks, tracks):
+    track_ids = {}
+    library = make_paths(tracks)
+    for n, path in enumerate(library):
+        track_ids[path] = n
+    before = rss_kb()
+
+    if mode == 'list':
+        played = []
+        for _ in range(fallbacks):
+            # find_flac_files builds new path strings on every call
+            flac_files = [os.path.join(os.path.dirname(p), os.path.basename(p)) for p in library]
+            random.shuffle(flac_files)
+            for flac_file in flac_files:
+                played.append(flac_file)
+        entries = len(played)
+    else:
+        played = history.PlayHistory(capacity=4096)
+        for _ in range(fallbacks):
+            flac_files = list(library)
+            random.shuffle(flac_files)
+            for flac_file in flac_files:
+                played.append(track_ids[flac_file])
+        entries = len(played)
+
+    print(f'{mode:8} {fallbacks} fallbacks x {tracks} tracks: {entries} entries kept, '
+          f'RSS +{(rss_kb() - before) / 1024:.1f} MiB ({rss_kb() / 1024:.1f} MiB total)')
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ('list', 'ring'):
+        run(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+        return
+    fallbacks = sys.argv[1] if len(sys.argv) > 1 else '10000'
+    tracks = sys.argv[2] if len(sys.argv) > 2 else '100'
+    for mode in ('list', 'ring'):
+        subprocess.run([sys.executable, __file__, mode, fallbacks, tracks], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+from array import array
+
+# Fixed-size play history.
+#
+# Tracks are stored as integer IDs from the library index (see
+# LibraryIndex.track_id) in a ring buffer, so memory stays the same no
+# matter how long the player runs. Positions count from the oldest entry
+# still kept; cursor is the position of the current track (-1 for none)
+# and stays on the same track when old entries fall off the end.
+
+
+class PlayHistory(object):
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.ids = array('l', [0]) * capacity
+        self.start = 0
+        self.count = 0
+        self.cursor = -1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self.count
+        if not 0 <= position < self.count:
+            raise IndexError('history position out of range')
+        return self.ids[(self.start + position) % self.capacity]
+
+    def __iter__(self):
+        for position in range(self.count):
+            yield self.ids[(self.start + position) % self.capacity]
+
+    def append(self, track_id):
+        if self.count < self.capacity:
+            self.ids[(self.start + self.count) % self.capacity] = track_id
+            self.count += 1
+        else:
+            # Full, overwrite the oldest entry
+            self.ids[self.start] = track_id
+            self.start = (self.start + 1) % self.capacity
+            if self.cursor >= 0:
+                self.cursor -= 1
+
+    def extend(self, track_ids):
+        track_ids = list(track_ids)
+        if len(track_ids) >= self.capacity:
+            # Only the newest entries survive anyway
+            self.clear()
+            track_ids = track_ids[-self.capacity:]
+        for track_id in track_ids:
+            self.append(track_id)
+
+    def clear(self):
+        self.start = self.count = 0
+        self.cursor = -1
+
+    def current(self):
+        if 0 <= self.cursor < self.count:
+            return self[self.cursor]
+        return None
+
+    def step(self, offset):
+        """Move the cursor by offset, wrapping around, returns the new track ID"""
+        if self.count == 0:
+            return None
+        if self.cursor < 0:
+            # Nothing current yet, forward starts at the oldest, back at the newest
+            self.cursor = offset - 1 if offset > 0 else self.count + offset
+        else:
+            self.cursor += offset
+        self.cursor %= self.count
+        return self[self.cursor]
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import ctypes
+import tracemalloc
+import i2c
+
+# Per-read cost of I2CMaster.transaction vs a PreparedRead.
+# Usage: python i2c-bench.py [reads]
+#
+# /dev/i2c is replaced by a shim for the I2C_RDWR ioctl that fills every
+# read message with a fake MGC3130 frame, so only the Python side of the
+# transaction is measured. The 'ioctl shim' line is the cost of the shim
+# alone and is included in the other two.
+
+ADDR = 0x42
+FRAME = bytes([26, 0, 1, 0x91]) + bytes(range(22))
+
+
+def fake_ioctl(fd, request, arg, mutate_flag=True):
+    if request != i2c.I2C_RDWR:
+        return 0
+    for n in range(arg.nmsgs):
+        msg = arg.msgs[n]
+        if msg.flags & i2c.I2C_M_RD:
+            ctypes.memmove(msg.buf, FRAME, min(msg.len, len(FRAME)))
+    return 0
+
+
+def measure(name, read, reads):
+    start = time.perf_counter()
+    for _ in range(reads):
+        data = read()
+    rate = reads / (time.perf_counter() - start)
+    assert bytes(data) == FRAME
+
+    tracemalloc.start()
+    transient = 0
+    for _ in range(1000):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        read()
+        transient += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    print(f'{name:12} {rate:12,.0f} reads/s  {transient / 1000:7.1f} bytes allocated/read')
+    return rate
+
+
+def main():
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    i2c.ioctl = fake_ioctl
+    master = i2c.I2CMaster.__new__(i2c.I2CMaster)
+    master.fd = os.open(os.devnull, os.O_RDWR)
+    try:
+        shim = master.prepare_read(ADDR, len(FRAME))
+        measure('ioctl shim', lambda: fake_ioctl(master.fd, i2c.I2C_RDWR, shim.ioctl_arg) or shim.view, reads)
+        old = measure('transaction', lambda: master.transaction(i2c.reading(ADDR, len(FRAME)))[0], reads)
+        new = measure('prepared', master.prepare_read(ADDR, len(FRAME)), reads)
+        print(f'speedup {new / old:.1f}x')
+    finally:
+        master.close()
+
+
+if __name__ == '__main__':
+    main()
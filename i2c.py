@@ -161,6 +161,41 @@ class I2CMaster(object):
     def write_bytes(self, addr, *bytes):
         return self.transaction(writing_bytes(addr, *bytes))
 
+    def prepare_read(self, addr, n_bytes):
+        """
+        Set up a read of n_bytes from addr that can be repeated cheaply.
+
+        Returns: a PreparedRead; call it to perform the read.
+        """
+        return PreparedRead(self, addr, n_bytes)
+
+
+class PreparedRead(object):
+    """A single-message read transaction built once and reused.
+
+    The read buffer, the i2c_msg array and the ioctl argument are
+    allocated when the PreparedRead is created. Each call performs the
+    ioctl and returns a memoryview over the same buffer, so nothing is
+    allocated or copied per read. The contents are only valid until the
+    next call; copy them (bytes(view)) if they need to be kept.
+
+    For example:
+
+        read_frame = i2c.prepare_read(0x42, 26)
+        frame = read_frame()
+    """
+
+    def __init__(self, master, addr, n_bytes):
+        self.master = master
+        self.buf = create_string_buffer(n_bytes)
+        self.msgs = (i2c_msg*1)(_new_i2c_msg(addr, I2C_M_RD, self.buf))
+        self.ioctl_arg = i2c_rdwr_ioctl_data(msgs=self.msgs, nmsgs=1)
+        self.view = memoryview(self.buf).cast('B')
+
+    def __call__(self):
+        ioctl(self.master.fd, I2C_RDWR, self.ioctl_arg)
+        return self.view
+
 
 
 def reading(addr, n_bytes):
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import library
+
+# Cold vs warm comparison of the library index against the old os.walk scan.
+# Usage: python library-bench.py [tracks] [music folder]
+# Without a music folder a synthetic library is generated in /tmp.
+
+TRACKS_PER_ALBUM = 12
+ALBUMS_PER_ARTIST = 4
+
+
+def find_flac_files(directory):
+    # The original find_flac_files from flick.py
+    flac_files = []
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.endswith('.flac'):
+                flac_files.append(os.path.join(root, file))
+    return flac_files
+
+
+def make_library(root, tracks):
+    albums = []
+    for n in range(tracks):
+        album_no = n // TRACKS_PER_ALBUM
+        album = os.path.join(f'Artist {album_no // ALBUMS_PER_ARTIST:04d}', f'Album {album_no:05d}')
+        if n % TRACKS_PER_ALBUM == 0:
+            os.makedirs(os.path.join(root, album))
+            albums.append(album)
+            # Cover art and playlists are skipped by the scan but still listed
+            open(os.path.join(root, album, 'cover.jpg'), 'w').close()
+        open(os.path.join(root, album, f'{n % TRACKS_PER_ALBUM + 1:02d} Track.flac'), 'w').close()
+    return albums
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+    tmp = tempfile.mkdtemp()
+    try:
+        if len(sys.argv) > 2:
+            root = sys.argv[2]
+            albums = [os.path.relpath(os.path.dirname(f), root) for f in find_flac_files(root)]
+        else:
+            root = os.path.join(tmp, 'Music')
+            print(f'Generating {tracks} tracks in {root}...')
+            albums = make_library(root, tracks)
+        db_path = os.path.join(tmp, 'library.db')
+        album = os.path.join(root, random.choice(albums))
+
+        ms, files = timed(find_flac_files, root)
+        print(f'os.walk, whole library       {ms:10.2f} ms  ({len(files)} tracks)')
+        ms, files = timed(find_flac_files, album)
+        print(f'os.walk, one album           {ms:10.2f} ms  ({len(files)} tracks)')
+
+        ms, index = timed(library.open_library, root, db_path)
+        print(f'index cold start (no db)     {ms:10.2f} ms  ({len(index)} tracks)')
+        ms, index = timed(library.open_library, root, db_path)
+        print(f'index warm start (db loaded) {ms:10.2f} ms  ({os.path.getsize(db_path)} byte db)')
+
+        ms, files = timed(index.all_files)
+        print(f'index, whole library         {ms:10.2f} ms  ({len(files)} tracks)')
+        ms, files = timed(index.files_under, album)
+        print(f'index, one album             {ms:10.2f} ms  ({len(files)} tracks)')
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+import os
+import bisect
+from array import array
+import sqlite3
+import threading
+import logging
+from contextlib import closing
+
+# Persistent index of the FLAC files below audio_folder.
+#
+# Every directory is stored with its mtime, the FLAC file names it holds
+# and its sub-directories. A directory's mtime only changes when entries
+# are added, removed or renamed in it, so on startup we stat every known
+# directory and only list the ones whose mtime moved. Queries walk the
+# in-memory tree from the album directory down, so they cost O(album size)
+# no matter how large the library is.
+
+EXTENSION = '.flac'
+
+
+class LibraryIndex(object):
+    """In-memory FLAC file tree backed by a small SQLite file."""
+
+    def __init__(self, root, db_path, extension=EXTENSION):
+        self.root = os.path.normpath(root)
+        self.db_path = db_path
+        self.extension = extension
+        self.lock = threading.RLock()
+        # dir path -> (mtime, [flac file names], [sub-directory names])
+        self.dirs = {}
+        self.dirty = False
+        # Compact integer IDs for tracks, handed out on first use and only
+        # valid for the lifetime of the process
+        self.track_ids = {}
+        self.track_paths = []
+        self.all_ids = None
+
+    def _changed(self):
+        # Caller holds self.lock
+        self.dirty = True
+        self.all_ids = None
+
+    def load(self):
+        """Load the saved index, returns the number of directories loaded"""
+        if not os.path.exists(self.db_path):
+            return 0
+        try:
+            with closing(sqlite3.connect(self.db_path)) as db:
+                rows = db.execute('SELECT path, mtime, files, subdirs FROM dirs').fetchall()
+        except sqlite3.Error as e:
+            logging.error(f'Could not load library index {self.db_path}: {e}')
+            return 0
+        with self.lock:
+            self.dirs = {}
+            self.all_ids = None
+            for path, mtime, files, subdirs in rows:
+                self.dirs[path] = (mtime, _split(files), _split(subdirs))
+        return len(self.dirs)
+
+    def save(self):
+        """Write the index back to disk if anything changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            rows = [(path, mtime, _join(files), _join(subdirs))
+                    for path, (mtime, files, subdirs) in self.dirs.items()]
+            self.dirty = False
+        tmp_path = self.db_path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with closing(sqlite3.connect(tmp_path)) as db:
+            db.execute('CREATE TABLE dirs (path TEXT PRIMARY KEY, mtime REAL, files TEXT, subdirs TEXT)')
+            db.executemany('INSERT INTO dirs VALUES (?, ?, ?, ?)', rows)
+            db.commit()
+        os.replace(tmp_path, self.db_path)
+
+    def refresh(self):
+        """Bring the index up to date with the disk
+
+        Only directories whose mtime changed since the last refresh are
+        listed again. Returns the number of directories that were rescanned.
+        """
+        rescanned = 0
+        seen = set()
+        stack = [self.root]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            seen.add(path)
+            with self.lock:
+                entry = self.dirs.get(path)
+            if entry is None or entry[0] != mtime:
+                entry = self._scan_dir(path, mtime)
+                rescanned += 1
+            stack.extend(os.path.join(path, d) for d in entry[2])
+
+        with self.lock:
+            for path in list(self.dirs):
+                if path not in seen:
+                    del self.dirs[path]
+                    self._changed()
+        if rescanned:
+            logging.info(f'Library index refreshed, {rescanned} directories rescanned')
+        return rescanned
+
+    def _scan_dir(self, path, mtime):
+        files, subdirs = self._list_dir(path)
+        entry = (mtime, files, subdirs)
+        with self.lock:
+            self.dirs[path] = entry
+            self._changed()
+        return entry
+
+    def _list_dir(self, path):
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.name.endswith(self.extension):
+                        files.append(entry.name)
+        except OSError as e:
+            logging.error(f'Could not list {path}: {e}')
+        files.sort()
+        subdirs.sort()
+        return files, subdirs
+
+    # Incremental updates, used by the library watcher. add_file and
+    # remove_file leave the stored directory mtime alone, and add_dir stores
+    # the mtime seen when it listed the tree, so a refresh() lists every
+    # directory changed since then. With inotify refresh() only runs at
+    # startup, on a queue overflow and a few seconds after the watcher saw
+    # a directory being created.
+
+    def add_file(self, path):
+        directory, name = os.path.split(path)
+        if not name.endswith(self.extension):
+            return False
+        with self.lock:
+            entry = self.dirs.get(directory)
+            if entry is None or name in entry[1]:
+                return False
+            bisect.insort(entry[1], name)
+            self._changed()
+        return True
+
+    def remove_file(self, path):
+        directory, name = os.path.split(path)
+        with self.lock:
+            entry = self.dirs.get(directory)
+            if entry is None or name not in entry[1]:
+                return False
+            entry[1].remove(name)
+            self._changed()
+        return True
+
+    def add_dir(self, path):
+        """Index a new directory tree, returns the directories added"""
+        parent, name = os.path.split(path)
+        with self.lock:
+            if parent not in self.dirs or path in self.dirs:
+                return []
+        # List the new tree without holding the lock so lookups never wait on the disk
+        scanned = {}
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                mtime = os.stat(current).st_mtime
+            except OSError:
+                continue
+            files, subdirs = self._list_dir(current)
+            scanned[current] = (mtime, files, subdirs)
+            stack.extend(os.path.join(current, d) for d in subdirs)
+        if path not in scanned:
+            return []
+        with self.lock:
+            parent_entry = self.dirs.get(parent)
+            if parent_entry is None:
+                return []
+            if name not in parent_entry[2]:
+                bisect.insort(parent_entry[2], name)
+            self.dirs.update(scanned)
+            self._changed()
+        return list(scanned)
+
+    def remove_dir(self, path):
+        """Drop a directory tree from the index, returns the directories removed"""
+        parent, name = os.path.split(path)
+        removed = []
+        with self.lock:
+            parent_entry = self.dirs.get(parent)
+            if parent_entry is not None and name in parent_entry[2]:
+                parent_entry[2].remove(name)
+            stack = [path]
+            while stack:
+                current = stack.pop()
+                entry = self.dirs.pop(current, None)
+                if entry is None:
+                    continue
+                removed.append(current)
+                stack.extend(os.path.join(current, d) for d in entry[2])
+            if removed or parent_entry is not None:
+                self._changed()
+        return removed
+
+    def directories(self):
+        with self.lock:
+            return list(self.dirs)
+
+    def files_under(self, directory):
+        """All FLAC files below directory, sorted by folder then file name"""
+        directory = os.path.normpath(directory)
+        with self.lock:
+            if directory not in self.dirs:
+                return []
+            flac_files = []
+            stack = [directory]
+            while stack:
+                path = stack.pop()
+                entry = self.dirs.get(path)
+                if entry is None:
+                    continue
+                flac_files.extend(os.path.join(path, f) for f in entry[1])
+                stack.extend(os.path.join(path, d) for d in reversed(entry[2]))
+            return flac_files
+
+    def track_id(self, path):
+        with self.lock:
+            track_id = self.track_ids.get(path)
+            if track_id is None:
+                track_id = len(self.track_paths)
+                self.track_paths.append(path)
+                self.track_ids[path] = track_id
+            return track_id
+
+    def track_path(self, track_id):
+        return self.track_paths[track_id]
+
+    def all_track_ids(self):
+        """IDs of every track in the library as an array, cached until the index changes"""
+        with self.lock:
+            if self.all_ids is None:
+                self.all_ids = array('l', (self.track_id(path) for path in self.all_files()))
+            return array('l', self.all_ids)
+
+    def all_files(self):
+        return self.files_under(self.root)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(entry[1]) for entry in self.dirs.values())
+
+
+def _join(names):
+    return '\0'.join(names)
+
+
+def _split(value):
+    return value.split('\0') if value else []
+
+
+def open_library(root, db_path):
+    """Load the saved index, sync it with the disk and save it again"""
+    index = LibraryIndex(root, db_path)
+    index.load()
+    index.refresh()
+    index.save()
+    return index
@@ -0,0 +1,155 @@
+import time
+import queue
+import logging
+import logging.handlers
+
+# Background logging for flick.py.
+#
+# logging.basicConfig(filename=...) writes every record to the SD card on
+# the thread that logged it, so the tag scanning thread used to wait on
+# the card for each "No tag found". Here loggers only put records on a
+# bounded in-memory queue (QueueHandler), and a QueueListener thread does
+# the formatting and writing. A run of identical messages is written once
+# and then summarized as "No tag found ×1200", and the log file is rotated
+# by size so it can not fill the card.
+
+FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+MAX_BYTES = 1024 * 1024
+BACKUP_COUNT = 3
+QUEUE_SIZE = 10000     # Records waiting for the writer before new ones are dropped
+SUMMARY_INTERVAL = 60  # Seconds a run of repeats is held before its count is written
+
+
+def parse_level(setting):
+    """(level, problem) for enable_logging: true/false, or a level name such as "INFO" """
+    if isinstance(setting, str):
+        level = logging.getLevelName(setting.upper())
+        if isinstance(level, int):
+            return level, None
+        return logging.DEBUG, f'Unknown log level {setting!r}, using DEBUG'
+    return (logging.DEBUG if setting else logging.WARNING), None
+
+
+def level_for(setting):
+    """Like parse_level, logging the problem, for when the pipeline is running"""
+    level, problem = parse_level(setting)
+    if problem:
+        logging.warning(problem)
+    return level
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Drops records when the queue is full instead of blocking the caller"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class CollapsingHandler(logging.Handler):
+    """Writes the first of a run of identical records and then a count
+
+    Runs on the listener thread only. A run is ended by a different record,
+    by close(), or after interval seconds so a long run still shows up.
+    """
+
+    def __init__(self, target, interval=SUMMARY_INTERVAL, clock=time.monotonic):
+        super().__init__()
+        self.target = target
+        self.interval = interval
+        self.clock = clock
+        self.last = None
+        self.last_key = None
+        self.repeats = 0
+        self.run_start = 0.0
+
+    def emit(self, record):
+        key = (record.name, record.levelno, record.getMessage())
+        if key == self.last_key:
+            self.repeats += 1
+            self.last = record
+            if self.clock() - self.run_start >= self.interval:
+                self._write_repeats()
+                self.run_start = self.clock()
+            return
+        self._write_repeats()
+        self.last_key = key
+        self.last = record
+        self.run_start = self.clock()
+        self.target.handle(record)
+
+    def _write_repeats(self):
+        if self.repeats:
+            summary = logging.makeLogRecord(self.last.__dict__)
+            summary.msg = f'{self.last.getMessage()} ×{self.repeats}'
+            summary.args = None
+            self.target.handle(summary)
+            self.repeats = 0
+
+    def flush(self):
+        self.target.flush()
+
+    def close(self):
+        self.acquire()
+        try:
+            self._write_repeats()
+        finally:
+            self.release()
+        self.target.close()
+        super().close()
+
+
+class LogPipeline(object):
+    def __init__(self, filename='app.log', level=logging.DEBUG, max_bytes=MAX_BYTES,
+                 backup_count=BACKUP_COUNT, queue_size=QUEUE_SIZE, interval=SUMMARY_INTERVAL):
+        file_handler = logging.handlers.RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter(FORMAT))
+        self.writer = CollapsingHandler(file_handler, interval)
+        self.queue = queue.Queue(queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.listener = logging.handlers.QueueListener(self.queue, self.writer)
+        self.reported_drops = 0
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(level)
+        self.listener.start()
+
+    def set_level(self, level):
+        logging.getLogger().setLevel(level)
+
+    def report_drops(self):
+        """Log how many records were dropped since the last call"""
+        dropped = self.handler.dropped - self.reported_drops
+        if dropped:
+            self.reported_drops += dropped
+            logging.warning(f'Log queue full, dropped {dropped} records')
+
+    def close(self):
+        self.report_drops()
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()  # Writes out everything still queued
+        self.writer.close()
+
+
+def start(filename='app.log', global_config=None):
+    """Set up the pipeline from flick.py's global_config"""
+    global_config = global_config or {}
+    # A bad level is logged once the pipeline is in place, logging it before
+    # would set up a stderr handler and never reach the log file
+    level, problem = parse_level(global_config.get('enable_logging', False))
+    pipeline = LogPipeline(filename, level=level,
+                           max_bytes=global_config.get('log_max_bytes', MAX_BYTES),
+                           backup_count=global_config.get('log_backups', BACKUP_COUNT))
+    if problem:
+        logging.warning(problem)
+    return pipeline
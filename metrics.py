@@ -0,0 +1,167 @@
+import time
+import bisect
+import logging
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Hot path timing for flick.py, cheap enough to leave on.
+#
+# Spans are recorded into fixed-size histograms: one bisect into a short
+# bucket list and a few additions under a lock, no allocation per sample.
+# serve() exposes every histogram (and any gauges) in the Prometheus text
+# format on http://127.0.0.1:<port>/metrics, so a slow tap in the field
+# can be traced to the PN532, the library, VLC or Bluetooth.
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram(object):
+    def __init__(self, name, help='', buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def time(self):
+        return Span(self)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+    def render(self):
+        counts, total, count = self.snapshot()
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f'{self.name}_sum {total}')
+        lines.append(f'{self.name}_count {count}')
+        return lines
+
+
+class Span(object):
+    __slots__ = ['histogram', 'start']
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Registry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.gauges = {}
+
+    def histogram(self, name, help='', buckets=BUCKETS):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(name, help, buckets)
+            return histogram
+
+    def gauge(self, name, help, read):
+        """read() is called on every scrape"""
+        with self.lock:
+            self.gauges[name] = (help, read)
+
+    def render(self):
+        with self.lock:
+            histograms = list(self.histograms.values())
+            gauges = list(self.gauges.items())
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        for name, (help, read) in gauges:
+            try:
+                value = read()
+            except Exception as e:
+                logging.error(f'Error reading gauge {name}: {e}')
+                continue
+            lines.extend([f'# HELP {name} {help}', f'# TYPE {name} gauge', f'{name} {value}'])
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def histogram(name, help='', buckets=BUCKETS):
+    return registry.histogram(name, help, buckets)
+
+
+def gauge(name, help, read):
+    registry.gauge(name, help, read)
+
+
+def span(name):
+    """with metrics.span('name_seconds'): ..."""
+    return Span(registry.histogram(name))
+
+
+def timed(name, help=''):
+    """Decorator recording every call of a function into a histogram"""
+    def decorate(function):
+        hist = registry.histogram(name, help)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the log
+
+
+def serve(port, host='127.0.0.1', registry=registry):
+    """Serve /metrics from a background thread, None if the port is taken"""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.error(f'Could not serve metrics on {host}:{port}: {e}')
+        return None
+    server.daemon_threads = True
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever, name='metrics')
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,143 @@
+import time
+import threading
+
+# Stand-in for RPi.GPIO so the GPIO-driven code can run off the Pi.
+#
+# It implements the part of the RPi.GPIO API used in this repo. Tests and
+# benchmarks drive inputs with set_input(), which fires edge callbacks
+# (honouring bouncetime) synchronously from the calling thread.
+
+BCM = 11
+BOARD = 10
+IN = 1
+OUT = 0
+HIGH = 1
+LOW = 0
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+RISING = 31
+FALLING = 32
+BOTH = 33
+RPI_REVISION = 3
+
+
+class MockGPIO(object):
+    BCM = BCM
+    BOARD = BOARD
+    IN = IN
+    OUT = OUT
+    HIGH = HIGH
+    LOW = LOW
+    PUD_OFF = PUD_OFF
+    PUD_DOWN = PUD_DOWN
+    PUD_UP = PUD_UP
+    RISING = RISING
+    FALLING = FALLING
+    BOTH = BOTH
+    RPI_REVISION = RPI_REVISION
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.mode = None
+        self.directions = {}
+        self.levels = {}
+        self.detect = {}     # channel -> [edge, bouncetime ms, [callbacks], last fire time]
+        self.detected = {}   # channel -> last edge seen since event_detected()
+        self.edge_cond = threading.Condition(self.lock)
+        self.reads = 0
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def getmode(self):
+        return self.mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        with self.lock:
+            self.directions[channel] = direction
+            if direction == OUT:
+                self.levels[channel] = LOW if initial is None else initial
+            elif pull_up_down == PUD_UP:
+                self.levels.setdefault(channel, HIGH)
+            else:
+                self.levels.setdefault(channel, LOW)
+
+    def input(self, channel):
+        with self.lock:
+            self.reads += 1
+            return self.levels.get(channel, LOW)
+
+    def output(self, channel, value):
+        with self.lock:
+            self.levels[channel] = HIGH if value else LOW
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        with self.lock:
+            if channel in self.detect:
+                raise RuntimeError('Conflicting edge detection already enabled for this GPIO channel')
+            self.detect[channel] = [edge, bouncetime or 0, [], None]
+            if callback is not None:
+                self.detect[channel][2].append(callback)
+
+    def add_event_callback(self, channel, callback):
+        with self.lock:
+            self.detect[channel][2].append(callback)
+
+    def remove_event_detect(self, channel):
+        with self.lock:
+            self.detect.pop(channel, None)
+            self.detected.pop(channel, None)
+
+    def event_detected(self, channel):
+        with self.lock:
+            return self.detected.pop(channel, None) is not None
+
+    def wait_for_edge(self, channel, edge, bouncetime=None, timeout=None):
+        with self.lock:
+            self.detected.pop(channel, None)
+            end = None if timeout is None else time.monotonic() + timeout / 1000.0
+            while self.detected.get(channel) not in ((RISING, FALLING) if edge == BOTH else (edge,)):
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.edge_cond.wait(remaining)
+            self.detected.pop(channel, None)
+            return channel
+
+    def cleanup(self, channel=None):
+        with self.lock:
+            if channel is None:
+                self.directions.clear()
+                self.levels.clear()
+                self.detect.clear()
+            else:
+                self.directions.pop(channel, None)
+                self.levels.pop(channel, None)
+                self.detect.pop(channel, None)
+
+    # Test hooks
+
+    def set_input(self, channel, value):
+        """Drive an input pin, firing any matching edge callbacks"""
+        value = HIGH if value else LOW
+        callbacks = []
+        with self.lock:
+            previous = self.levels.get(channel, LOW)
+            self.levels[channel] = value
+            if previous == value:
+                return
+            edge = RISING if value == HIGH else FALLING
+            self.detected[channel] = edge
+            self.edge_cond.notify_all()
+            detect = self.detect.get(channel)
+            if detect is not None and detect[0] in (edge, BOTH):
+                now = time.monotonic()
+                if detect[3] is None or (now - detect[3]) * 1000.0 >= detect[1]:
+                    detect[3] = now
+                    callbacks = list(detect[2])
+        for callback in callbacks:
+            callback(channel)
@@ -0,0 +1,161 @@
+import sys
+import time
+import random
+import threading
+import statistics
+import mockgpio
+import fakepn532
+import nfcdetect
+import tagevents
+
+# Simulated-reader harness for the PN532 detection modes.
+# Usage: python nfc-bench.py [taps] [idle seconds]
+#
+# Runs the old 0.5 s polling loop, the adaptive backoff poller and the
+# IRQ-driven detector against fakepn532 and reports detection latency,
+# CPU use and I2C transactions while the reader is idle. A tag is then
+# left on the reader for a second behind the scan loop's debouncer, where
+# the reads must stay bounded by the poll interval, and the IRQ detector
+# gets a corrupted response, after which the next tap must still be seen.
+
+IRQ_PIN = 4
+I2C_LATENCY = 0.0005  # Roughly one short PN532 frame at 100 kHz
+HOLD_SECONDS = 1.0
+MAX_HOLD_READS = 15   # One tag read per 0.1 s poll interval, with some slack
+
+
+class LegacyPoller(object):
+    """The scan loop from flick.py before event-driven detection"""
+
+    def __init__(self, pn532):
+        self.pn532 = pn532
+
+    def wait_for_tag(self, timeout=None):
+        uid = self.pn532.read_passive_target(timeout=0.5)
+        if uid is None:
+            time.sleep(0.1)
+        return uid
+
+    def close(self):
+        pass
+
+
+def run(name, make_detector, taps, idle):
+    gpio = mockgpio.MockGPIO()
+    pn532 = fakepn532.FakePN532(gpio, IRQ_PIN, latency=I2C_LATENCY)
+    detector = make_detector(pn532, gpio)
+    detections = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            uid = detector.wait_for_tag(timeout=0.5)
+            if uid is not None:
+                detections.append(time.monotonic())
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    time.sleep(0.5)
+
+    # Idle: nothing on the reader
+    transactions = pn532.transactions
+    cpu = time.process_time()
+    time.sleep(idle)
+    idle_cpu = (time.process_time() - cpu) / idle * 100
+    idle_tps = (pn532.transactions - transactions) / idle
+
+    # Taps: put a tag down, wait for it to be seen, take it away
+    latencies = []
+    tag = fakepn532.FakeTag(b'\x04\x11\x22\x33\x44\x55\x66')
+    for _ in range(taps):
+        time.sleep(random.uniform(0.3, 0.8))
+        seen = len(detections)
+        placed = time.monotonic()
+        pn532.place(tag)
+        while len(detections) == seen and time.monotonic() - placed < 2:
+            time.sleep(0.001)
+        if len(detections) > seen:
+            latencies.append((detections[seen] - placed) * 1000)
+        time.sleep(0.1)
+        pn532.remove()
+
+    stop.set()
+    thread.join()
+    detector.close()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else float('nan')
+    median = statistics.median(latencies) if latencies else float('nan')
+    print(f'{name:10} latency p50 {median:7.1f} ms  p95 {p95:7.1f} ms  '
+          f'idle CPU {idle_cpu:5.2f} %  idle I2C {idle_tps:6.1f} transactions/s  ({len(latencies)}/{taps} taps seen)')
+
+
+def hold(name, make_detector):
+    """Reads while a tag stays on the reader, with flick.py's debouncer"""
+    gpio = mockgpio.MockGPIO()
+    pn532 = fakepn532.FakePN532(gpio, IRQ_PIN, latency=I2C_LATENCY)
+    detector = make_detector(pn532, gpio)
+    debouncer = tagevents.TagDebouncer(hold_time=0.5)
+    pn532.place(fakepn532.FakeTag(b'\x04\x11\x22\x33\x44\x55\x66'))
+    transactions = pn532.transactions
+    loops = accepted = 0
+    end = time.monotonic() + HOLD_SECONDS
+    while time.monotonic() < end:
+        uid = detector.wait_for_tag(timeout=0.25)
+        loops += 1
+        if uid is not None and debouncer.accept(bytes(uid)):
+            accepted += 1
+    reads = pn532.transactions - transactions
+    detector.close()
+    print(f'{name:10} tag held {HOLD_SECONDS:.0f} s: {loops} scan loops, {reads} I2C transactions, '
+          f'{accepted} accepted')
+    return reads <= MAX_HOLD_READS * 2  # A detection is up to two transactions
+
+
+def bad_frame():
+    """A tap whose response fails its checksum must not stop detection"""
+    gpio = mockgpio.MockGPIO()
+    pn532 = fakepn532.FakePN532(gpio, IRQ_PIN, latency=I2C_LATENCY)
+    detector = nfcdetect.IrqTagDetector(pn532, gpio, IRQ_PIN)
+    tag = fakepn532.FakeTag(b'\x04\x11\x22\x33\x44\x55\x66')
+    detector.wait_for_tag(timeout=0.1)  # Armed, nothing on the reader
+    pn532.corrupt_next()
+    pn532.place(tag)
+    try:
+        detector.wait_for_tag(timeout=0.5)
+        failed = False
+    except RuntimeError:
+        failed = True
+    pn532.remove()
+    time.sleep(0.3)
+    pn532.place(tag)
+    uid = None
+    end = time.monotonic() + 2
+    while uid is None and time.monotonic() < end:
+        try:
+            uid = detector.wait_for_tag(timeout=0.25)
+        except RuntimeError:
+            pass
+    detector.close()
+    print(f'irq        bad frame {"raised" if failed else "not seen"}, next tap {"seen" if uid else "missed"}')
+    return uid is not None
+
+
+def main():
+    taps = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    idle = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    run('legacy', lambda pn532, gpio: LegacyPoller(pn532), taps, idle)
+    run('backoff', lambda pn532, gpio: nfcdetect.BackoffTagPoller(pn532), taps, idle)
+    run('irq', lambda pn532, gpio: nfcdetect.IrqTagDetector(pn532, gpio, IRQ_PIN), taps, idle)
+    bounded = [hold('backoff', lambda pn532, gpio: nfcdetect.BackoffTagPoller(pn532)),
+               hold('irq', lambda pn532, gpio: nfcdetect.IrqTagDetector(pn532, gpio, IRQ_PIN))]
+    if not all(bounded):
+        print('Reads while a tag is held are not bounded by the poll interval')
+        sys.exit(1)
+    if not bad_frame():
+        print('A corrupted PN532 response stopped tag detection')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
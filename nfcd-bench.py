@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+import statistics
+import fakepn532
+import nfcdetect
+import nfcd
+
+# The player's tag scanner and a web writer sharing one simulated PN532.
+# Usage: python nfcd-bench.py [seconds]
+#
+# 'separate' is how flick.py and server.py used to run: each drives the
+# reader on its own, and the bus wrapper counts commands that overlap
+# (on the real I2C bus those are the failed reads). 'nfcd' routes both
+# through one NfcService, the writer over the Unix socket. Reports
+# overlapping commands, tap-to-UID latency of the scanner and the latency
+# of the writer's requests.
+
+UID = bytes.fromhex('04010203040506')
+
+
+class SharedBus(object):
+    """Wraps the fake reader and counts commands that overlap"""
+
+    def __init__(self, pn532):
+        self.pn532 = pn532
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.collisions = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.pn532, name)
+        if not callable(attr):
+            return attr
+
+        def command(*args, **kwargs):
+            with self.lock:
+                self.busy += 1
+                if self.busy > 1:
+                    self.collisions += 1
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.busy -= 1
+        return command
+
+
+def run(name, seconds, shared):
+    pn532 = fakepn532.FakePN532(latency=0.002, poll_interval=0.005)
+    bus = SharedBus(pn532)
+    detector = nfcdetect.BackoffTagPoller(bus)
+    stop = threading.Event()
+    taps, requests = [], []
+
+    if shared:
+        service = nfcd.NfcService(bus, detector=detector)
+        path = os.path.join(tempfile.mkdtemp(), 'nfcd.sock')
+        server = nfcd.serve(service, path)
+        client = nfcd.NfcClient(path)
+
+        def wait_for_tag():
+            return service.call(detector.wait_for_tag, 0.25, priority=nfcd.PLAYBACK)
+
+        def write():
+            client.write_payload('Stray Kids/NOEASY/', timeout=0.5)
+    else:
+        writer = nfcd.NfcService(bus)  # Only used for its reader and writer
+
+        def wait_for_tag():
+            return detector.wait_for_tag(0.25)
+
+        def write():
+            uid = bus.read_passive_target(timeout=0.5)
+            writer.writer.write_payload(uid, 'Stray Kids/NOEASY/')
+
+    placed = [None]
+    seen = threading.Event()
+
+    def scanner():
+        while not stop.is_set():
+            uid = wait_for_tag()
+            if uid is not None and placed[0] is not None and not seen.is_set():
+                taps.append((time.monotonic() - placed[0]) * 1000)
+                seen.set()
+
+    def web_writer():
+        while not stop.is_set():
+            start = time.monotonic()
+            try:
+                write()
+                requests.append((time.monotonic() - start) * 1000)
+            except Exception:
+                pass
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=scanner), threading.Thread(target=web_writer)]
+    for thread in threads:
+        thread.start()
+
+    # Tap a tag every 0.8 s and time how long the scanner takes to see it
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pn532.remove()
+        time.sleep(0.3)
+        seen.clear()
+        placed[0] = time.monotonic()
+        pn532.place(fakepn532.FakeTag(UID))
+        seen.wait(1)
+        time.sleep(max(0, placed[0] + 0.5 - time.monotonic()))  # Tag stays for half a second
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    if shared:
+        server.server_close()
+        service.close()
+
+    print(f'{name:9} overlapping commands {bus.collisions:5}  '
+          f'tap p50 {statistics.median(taps):6.1f} ms  '
+          f'write requests {len(requests):4}  p50 {statistics.median(requests):6.1f} ms  '
+          f'max {max(requests):6.1f} ms')
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    logging.disable(logging.ERROR)  # Tags are pulled away mid-write on purpose
+    run('separate', seconds, shared=False)
+    run('nfcd', seconds, shared=True)
+
+
+if __name__ == '__main__':
+    main()
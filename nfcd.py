@@ -0,0 +1,275 @@
+import os
+import json
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from collections import deque
+from concurrent.futures import Future
+import ntag
+import tagindex
+import tagwriter
+
+# Single owner of the PN532.
+#
+# Every bus operation runs as a job on one worker thread, so the player's
+# tag scanner and the web writers never talk to the chip at the same time.
+# The playback scanner's jobs go first, but a waiting client job never
+# waits for more than one playback job. Other processes reach the reader
+# through a Unix socket, one JSON request and one JSON response per line:
+#
+#   {"op": "scan", "timeout": 0.5}           -> {"ok": true, "uid": "04A1..."}
+#   {"op": "read-payload", "timeout": 0.5}   -> {"ok": true, "uid": ..., "payload": "tag3"}
+#   {"op": "write-payload", "payload": "tag3", "uid": "04A1..."}
+#                                            -> {"ok": true, "uid": ..., "written": 1, ...}
+#
+# uid is optional for write-payload, if given the write is refused when a
+# different tag is on the reader. Errors come back as {"ok": false, "error": ...}.
+#
+# flick.py runs the service in-process. Without the player, run
+# python nfcd.py (add --fake to use a simulated reader with one tag on it).
+
+SOCKET_PATH = '/tmp/rpi-nfc-music.sock'
+
+PLAYBACK = 0
+CLIENT = 1
+
+MAX_TIMEOUT = 2.0  # Longest a client may hold the bus waiting for a tag
+
+
+class NfcError(Exception):
+    pass
+
+
+class NfcService(object):
+    def __init__(self, pn532, reader=None, writer=None, detector=None):
+        self.pn532 = pn532
+        self.reader = reader or ntag.TagReader(pn532)
+        self.writer = writer or tagwriter.TagWriter(pn532, reader=self.reader)
+        self.detector = detector  # Playback tag detector, disarmed by client jobs
+        self.jobs = {PLAYBACK: deque(), CLIENT: deque()}
+        self.cond = threading.Condition()
+        self.last_priority = None
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='nfcd')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, fn, *args, priority=CLIENT):
+        future = Future()
+        with self.cond:
+            if not self.running:
+                raise NfcError('NFC service stopped')
+            self.jobs[priority].append((future, fn, args))
+            self.cond.notify()
+        return future
+
+    def call(self, fn, *args, priority=CLIENT, timeout=None):
+        """Run fn(*args) on the reader thread and return its result"""
+        return self.submit(fn, *args, priority=priority).result(timeout)
+
+    def _next_job(self):
+        # Caller holds self.cond
+        playback, client = self.jobs[PLAYBACK], self.jobs[CLIENT]
+        if client and (not playback or self.last_priority == PLAYBACK):
+            self.last_priority = CLIENT
+            return client.popleft(), CLIENT
+        self.last_priority = PLAYBACK
+        return playback.popleft(), PLAYBACK
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not (self.jobs[PLAYBACK] or self.jobs[CLIENT]):
+                    self.cond.wait()
+                if not self.running:
+                    return
+                (future, fn, args), priority = self._next_job()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            if priority == CLIENT and self.detector is not None:
+                # The client's commands replaced the armed InListPassiveTarget
+                self.detector.disarm()
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            for jobs in self.jobs.values():
+                for future, fn, args in jobs:
+                    future.cancel()
+                jobs.clear()
+            self.cond.notify_all()
+        self.thread.join(1)
+
+    # Client operations, each runs as one job
+
+    def _scan(self, timeout):
+        uid = self.pn532.read_passive_target(timeout=min(timeout, MAX_TIMEOUT))
+        if uid is None:
+            raise NfcError('No NFC tag found, please try again')
+        return uid
+
+    def _read_payload(self, timeout):
+        uid = self._scan(timeout)
+        payload = self.reader.read_payload(uid)
+        if payload is None:
+            raise NfcError('Could not read the tag, hold it still and try again')
+        return uid, payload
+
+    def _write_payload(self, payload, uid, timeout):
+        found = self._scan(timeout)
+        if uid is not None and bytes(found) != bytes(uid):
+            raise NfcError('A different tag is on the reader, scan it again')
+        try:
+            return found, self.writer.write_payload(found, payload)
+        except tagwriter.TagWriteError as e:
+            raise NfcError(str(e))
+
+    def scan(self, timeout=0.5):
+        return self.call(self._scan, timeout)
+
+    def read_payload(self, timeout=0.5):
+        return self.call(self._read_payload, timeout)
+
+    def write_payload(self, payload, uid=None, timeout=0.5):
+        return self.call(self._write_payload, payload, uid, timeout)
+
+    def handle(self, request):
+        """Answer one socket request"""
+        op = request.get('op')
+        timeout = float(request.get('timeout', 0.5))
+        if op == 'scan':
+            return {'uid': tagindex.uid_hex(self.scan(timeout))}
+        if op == 'read-payload':
+            uid, payload = self.read_payload(timeout)
+            return {'uid': tagindex.uid_hex(uid), 'payload': payload}
+        if op == 'write-payload':
+            uid = request.get('uid')
+            uid = bytes.fromhex(tagindex.uid_hex(uid)) if uid else None
+            uid, result = self.write_payload(request['payload'], uid, timeout)
+            return {'uid': tagindex.uid_hex(uid), 'pages': result.pages, 'written': result.written,
+                    'transactions': result.transactions, 'seconds': result.seconds}
+        raise NfcError(f'Unknown request {op!r}')
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.service.handle(json.loads(line))
+                response['ok'] = True
+            except Exception as e:
+                response = {'ok': False, 'error': str(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class NfcServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, service, path=SOCKET_PATH):
+        self.service = service
+        if os.path.exists(path):
+            os.remove(path)  # Left over from a previous run
+        socketserver.UnixStreamServer.__init__(self, path, _RequestHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def serve(service, path=SOCKET_PATH):
+    """Serve the socket API from a background thread"""
+    server = NfcServer(service, path)
+    thread = threading.Thread(target=server.serve_forever, name='nfcd-socket')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class NfcClient(object):
+    """The socket API as used by server.py, write-web.py and write.py"""
+
+    def __init__(self, path=SOCKET_PATH):
+        self.path = path
+
+    def _request(self, request):
+        timeout = request.get('timeout', 0.5) + 5  # Room for queuing behind other jobs
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect(self.path)
+                sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+                response = sock.makefile('rb').readline()
+        except OSError as e:
+            raise NfcError(f'NFC reader service not reachable at {self.path}: {e}')
+        if not response:
+            raise NfcError('NFC reader service closed the connection')
+        response = json.loads(response)
+        if not response.pop('ok'):
+            raise NfcError(response['error'])
+        return response
+
+    def scan(self, timeout=0.5):
+        """UID of the tag on the reader as bytes"""
+        return bytes.fromhex(self._request({'op': 'scan', 'timeout': timeout})['uid'])
+
+    def read_payload(self, timeout=0.5):
+        """(uid, payload) of the tag on the reader"""
+        response = self._request({'op': 'read-payload', 'timeout': timeout})
+        return bytes.fromhex(response['uid']), response['payload']
+
+    def write_payload(self, payload, uid=None, timeout=0.5):
+        request = {'op': 'write-payload', 'payload': payload, 'timeout': timeout}
+        if uid is not None:
+            request['uid'] = tagindex.uid_hex(uid)
+        return self._request(request)
+
+
+def open_pn532(fake=False):
+    if fake:
+        import fakepn532
+        pn532 = fakepn532.FakePN532(latency=0.002)
+        pn532.place(fakepn532.FakeTag(bytes.fromhex('04010203040506')))
+        return pn532, None
+    import board
+    import busio
+    from adafruit_pn532.i2c import PN532_I2C
+    i2c = busio.I2C(board.SCL, board.SDA)
+    pn532 = PN532_I2C(i2c, debug=False)
+    pn532.SAM_configuration()
+    return pn532, i2c
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PN532 reader service')
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    parser.add_argument('--fake', action='store_true', help='simulated reader with one tag on it')
+    parser.add_argument('--config', default='config.json', help='tag_uids.json is kept next to it')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    pn532, i2c = open_pn532(args.fake)
+    reader = ntag.TagReader(pn532)
+    writer = tagwriter.TagWriter(pn532, reader=reader, index=tagindex.open_index(args.config))
+    service = NfcService(pn532, reader, writer)
+    server = NfcServer(service, args.socket)
+    print(f'NFC reader service listening on {args.socket}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if i2c is not None:
+            i2c.deinit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import time
+import logging
+import threading
+
+# Tag presence detection for the PN532.
+#
+# IrqTagDetector arms InListPassiveTarget once and then sleeps until the
+# PN532 pulls its IRQ line low, so an idle reader costs no CPU and no I2C
+# traffic. BackoffTagPoller is the fallback when the IRQ line is not wired
+# up: the PN532 waits for a target for up to read_timeout per
+# read_passive_target, with short gaps between reads that stretch while
+# the field stays empty. A tag left on the reader is read again at most
+# every hold_interval.
+#
+# Both expose wait_for_tag(timeout) which returns the UID or None, and
+# disarm() for when something else has used the reader in between.
+
+
+class IrqTagDetector(object):
+    def __init__(self, pn532, gpio, irq_pin, rearm_delay=0.2):
+        self.pn532 = pn532
+        self.gpio = gpio
+        self.irq_pin = irq_pin
+        self.rearm_delay = rearm_delay
+        self.ready = threading.Event()
+        self.armed = False
+        self.last_detect = 0.0
+        gpio.setup(irq_pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.add_event_detect(irq_pin, gpio.FALLING, callback=self._on_irq)
+
+    def _on_irq(self, channel):
+        self.ready.set()
+
+    def wait_for_tag(self, timeout=None):
+        if not self.armed:
+            # Don't re-arm straight away while a tag is left on the reader,
+            # it would answer immediately and keep the bus busy
+            delay = self.last_detect + self.rearm_delay - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if not self.pn532.listen_for_passive_target():
+                logging.error('PN532 did not acknowledge InListPassiveTarget')
+                return None
+            # IRQ also went low for the ACK frame read by the call above.
+            # Forget that edge, unless a target answered right away.
+            self.ready.clear()
+            if self.gpio.input(self.irq_pin) == self.gpio.LOW:
+                self.ready.set()
+            self.armed = True
+        # Stay armed across timeouts, the PN532 keeps waiting for a target
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if end is None else max(end - time.monotonic(), 0)
+            if not self.ready.wait(remaining):
+                return None
+            self.ready.clear()
+            try:
+                uid = self.pn532.get_passive_target(timeout=0.1)
+            except Exception:
+                # A bad frame (preamble or checksum error) still took the
+                # response, IRQ won't fall again until the next arm
+                self.armed = False
+                raise
+            if uid is not None:
+                self.armed = False
+                self.last_detect = time.monotonic()
+                return uid
+            # A stray edge without a target response, the command is still pending
+
+    def disarm(self):
+        # Another command was sent to the PN532, arm again on the next wait
+        self.armed = False
+
+    def close(self):
+        self.gpio.remove_event_detect(self.irq_pin)
+
+
+class BackoffTagPoller(object):
+    def __init__(self, pn532, min_interval=0.02, max_interval=0.1, backoff=1.5, read_timeout=0.25,
+                 hold_interval=0.1):
+        self.pn532 = pn532
+        self.hold_interval = hold_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.read_timeout = read_timeout
+        self.interval = min_interval
+        self.next_read = 0.0
+
+    def wait_for_tag(self, timeout=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # A tag left on the reader answers every read straight away,
+            # still wait hold_interval before reading it again
+            delay = self.next_read - time.monotonic()
+            if delay > 0:
+                if end is not None and end - time.monotonic() <= delay:
+                    time.sleep(max(end - time.monotonic(), 0))
+                    return None
+                time.sleep(delay)
+            # The reader waits for a target itself, but no longer than the
+            # caller wants to wait, nfcd's client jobs queue behind it
+            read_timeout = self.read_timeout
+            if end is not None:
+                read_timeout = max(min(read_timeout, end - time.monotonic()), 0.01)
+            uid = self.pn532.read_passive_target(timeout=read_timeout)
+            if uid is not None:
+                self.interval = self.min_interval
+                self.next_read = time.monotonic() + self.hold_interval
+                return uid
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+            delay = self.interval
+            if end is not None:
+                delay = min(delay, end - time.monotonic())
+                if delay <= 0:
+                    return None
+            time.sleep(delay)
+
+    def disarm(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def open_detector(pn532, gpio=None, irq_pin=None):
+    """IRQ-driven detector if an IRQ pin is configured, else the poller"""
+    if gpio is not None and irq_pin is not None:
+        try:
+            return IrqTagDetector(pn532, gpio, irq_pin)
+        except Exception as e:
+            logging.error(f'Could not set up PN532 IRQ on GPIO {irq_pin}, polling instead: {e}')
+    return BackoffTagPoller(pn532)
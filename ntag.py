@@ -0,0 +1,223 @@
+import logging
+import threading
+from collections import OrderedDict
+
+# Tag payload reader for NTAG21x tags on the PN532.
+#
+# The first READ starts at page 3, so one transaction returns the
+# capability container (which tells us the size of user memory) together
+# with the first 12 bytes of user data. That covers most album keys. Longer
+# payloads are fetched with FAST_READ page ranges, falling back to 16 byte
+# READs. Two payload formats are understood:
+#
+#   - an NDEF message (TLV 0x03) holding a text, URI or other record
+#   - plain text starting at page 4, ended by a NUL byte, as written by
+#     write.py and server.py
+#
+# Payloads are cached by UID, so tapping a known tag again skips the data
+# read entirely.
+
+IN_DATA_EXCHANGE = 0x40
+NTAG_READ = 0x30
+NTAG_FAST_READ = 0x3A
+
+CC_PAGE = 3
+USER_START_PAGE = 4
+READ_PAGES = 4         # A READ always returns 4 pages
+FAST_READ_PAGES = 32   # Pages per FAST_READ, keeps the PN532 frame short
+
+TLV_NULL = 0x00
+TLV_NDEF = 0x03
+TLV_TERMINATOR = 0xFE
+
+URI_PREFIXES = {0: '', 1: 'http://www.', 2: 'https://www.', 3: 'http://', 4: 'https://'}
+
+
+def parse_ndef_record(message):
+    """Text of the first record in an NDEF message"""
+    if len(message) < 3:
+        return ''
+    header = message[0]
+    tnf = header & 0x07
+    type_length = message[1]
+    pos = 2
+    if header & 0x10:  # Short record
+        payload_length = message[pos]
+        pos += 1
+    else:
+        payload_length = int.from_bytes(message[pos:pos + 4], 'big')
+        pos += 4
+    id_length = 0
+    if header & 0x08:
+        id_length = message[pos]
+        pos += 1
+    record_type = bytes(message[pos:pos + type_length])
+    pos += type_length + id_length
+    payload = bytes(message[pos:pos + payload_length])
+
+    if tnf == 0x01 and record_type == b'T' and payload:
+        status = payload[0]
+        encoding = 'utf-16' if status & 0x80 else 'utf-8'
+        return payload[1 + (status & 0x3f):].decode(encoding, errors='replace')
+    if tnf == 0x01 and record_type == b'U' and payload:
+        return URI_PREFIXES.get(payload[0], '') + payload[1:].decode('utf-8', errors='replace')
+    return payload.decode('utf-8', errors='replace')
+
+
+def decode_payload(data):
+    """Decode user memory read from page 4 on
+
+    Returns (payload, None) once the payload is complete, or (None, n) if
+    at least n bytes of user memory are needed to decode it.
+    """
+    if not data:
+        return None, READ_PAGES * 4
+    if data[0] > TLV_NDEF and data[0] != TLV_TERMINATOR:
+        # Plain text, ended by a NUL
+        end = data.find(b'\x00')
+        if end < 0:
+            return None, len(data) + FAST_READ_PAGES * 4
+        return bytes(data[:end]).decode('utf-8', errors='replace').strip(), None
+
+    pos = 0
+    while pos < len(data):
+        tlv = data[pos]
+        if tlv == TLV_NULL:
+            pos += 1
+            continue
+        if tlv == TLV_TERMINATOR:
+            return '', None
+        if pos + 2 > len(data):
+            return None, pos + 4
+        length = data[pos + 1]
+        header = 2
+        if length == 0xFF:
+            if pos + 4 > len(data):
+                return None, pos + 4
+            length = data[pos + 2] << 8 | data[pos + 3]
+            header = 4
+        end = pos + header + length
+        if tlv == TLV_NDEF:
+            if end > len(data):
+                return None, end
+            return parse_ndef_record(data[pos + header:end]), None
+        pos = end  # Lock / memory control TLVs
+    return None, pos + 4
+
+
+def user_bytes(cc):
+    """Size of user memory from the capability container (page 3)"""
+    # CC byte 2 is the size of user memory / 8 (0x3E on an NTAG215)
+    return cc[2] * 8 if cc[0] == 0xE1 and cc[2] else 4 * 4
+
+
+class TagReader(object):
+    def __init__(self, pn532, cache_size=64, fast_read=True):
+        self.pn532 = pn532
+        self.cache_size = cache_size
+        self.fast_read = fast_read
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.transactions = 0
+
+    def cached(self, uid):
+        with self.lock:
+            payload = self.cache.get(bytes(uid))
+            if payload is not None:
+                self.cache.move_to_end(bytes(uid))
+            return payload
+
+    def remember(self, uid, payload):
+        with self.lock:
+            self.cache[bytes(uid)] = payload
+            self.cache.move_to_end(bytes(uid))
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def forget(self, uid=None):
+        """Drop a cached payload, e.g. after the tag was rewritten"""
+        with self.lock:
+            if uid is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(bytes(uid), None)
+
+    def read_payload(self, uid):
+        """Payload of the tag that was just detected, None if it can't be read"""
+        payload = self.cached(uid)
+        if payload is not None:
+            return payload
+        payload = self._read_uncached()
+        if payload is not None:
+            self.remember(uid, payload)
+        return payload
+
+    def _read_uncached(self):
+        first = self._read(CC_PAGE)
+        if first is None:
+            return None
+        capacity = user_bytes(first[0:4])
+        data = bytearray(first[4:])
+        end_page = USER_START_PAGE + capacity // 4
+
+        while True:
+            payload, needed = decode_payload(data)
+            if payload is not None:
+                return payload
+            needed = min(needed, capacity)
+            if len(data) >= needed:
+                # Ran out of user memory without an end marker
+                return bytes(data).split(b'\x00')[0].decode('utf-8', errors='replace').strip()
+            page = USER_START_PAGE + len(data) // 4
+            last = min(USER_START_PAGE + (needed + 3) // 4, end_page) - 1
+            chunk = self.read_pages(page, last)
+            if chunk is None:
+                return None
+            data += chunk
+
+    def read_pages(self, first, last):
+        """Pages first..last (inclusive) in as few transactions as possible"""
+        data = bytearray()
+        page = first
+        while page <= last:
+            if self.fast_read:
+                end = min(last, page + FAST_READ_PAGES - 1)
+                chunk = self._fast_read(page, end)
+                if chunk is not None:
+                    data += chunk
+                    page = end + 1
+                    continue
+                # Not an NTAG21x, or the PN532 did not like the frame
+                logging.debug('FAST_READ failed, falling back to READ')
+                self.fast_read = False
+            chunk = self._read(page)
+            if chunk is None:
+                return None
+            data += chunk[:(min(last, page + READ_PAGES - 1) - page + 1) * 4]
+            page += READ_PAGES
+        return data
+
+    def _read(self, page):
+        self.transactions += 1
+        try:
+            data = self.pn532.mifare_classic_read_block(page)
+        except RuntimeError as e:
+            logging.error(f'Error reading tag page {page}: {e}')
+            return None
+        if data is None or len(data) < 16:
+            return None
+        return bytearray(data)
+
+    def _fast_read(self, first, last):
+        self.transactions += 1
+        count = (last - first + 1) * 4
+        try:
+            response = self.pn532.call_function(IN_DATA_EXCHANGE,
+                                                params=[0x01, NTAG_FAST_READ, first, last],
+                                                response_length=1 + count)
+        except (RuntimeError, AttributeError) as e:
+            logging.debug(f'FAST_READ {first}-{last} failed: {e}')
+            return None
+        if not response or response[0] != 0x00 or len(response) < 1 + count:
+            return None
+        return bytearray(response[1:1 + count])
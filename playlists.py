@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import threading
+import metrics
+
+# Tag -> playlist resolution cache.
+#
+# Every tag in config['tags'] is resolved ahead of time into its ordered
+# track list and the matching media objects, so a tap only has to hand
+# a ready list to VLC. Resolution runs at startup and again whenever the
+# config or the library changes, never on the tag scanning path.
+
+
+resolve_time = metrics.histogram('flick_resolve_folder_seconds', 'Album folder to ordered tracks and media')
+
+
+class Playlist(object):
+    __slots__ = ['folder', 'tracks', 'media', 'resolve_ms']
+
+    def __init__(self, folder, tracks, media, resolve_ms):
+        self.folder = folder
+        self.tracks = tracks
+        self.media = media
+        self.resolve_ms = resolve_ms
+
+
+class TagPlaylists(object):
+    """Resolved playlists for the configured tags
+
+    media_factory turns a file path into a (pre-parsed) media object,
+    in flick.py that is vlc_instance.media_new plus parse_with_options.
+    """
+
+    def __init__(self, index, audio_folder, media_factory=None, order=None):
+        self.index = index
+        self.audio_folder = audio_folder
+        self.media_factory = media_factory
+        self.order = order  # order(paths) puts an album's tracks in play order
+        self.lock = threading.Lock()
+        self.resolve_lock = threading.Lock()  # One resolve_all at a time, see there
+        self.tags = {}
+        self.playlists = {}
+
+    def _tracks(self, folder):
+        tracks = self.index.files_under(os.path.join(self.audio_folder, folder))
+        if callable(self.order):
+            tracks = self.order(tracks)
+        return tracks
+
+    def resolve_folder(self, folder):
+        start = time.perf_counter()
+        tracks = self._tracks(folder)
+        if callable(self.media_factory):
+            media = [self.media_factory(track) for track in tracks]
+        else:
+            media = []
+        seconds = time.perf_counter() - start
+        resolve_time.observe(seconds)
+        return Playlist(folder, tracks, media, seconds * 1000)
+
+    def resolve_all(self, tags=None):
+        """Resolve every tag, reusing playlists whose tracks did not change"""
+        # The library watcher and a config reload both call this. Without
+        # the resolve lock a watcher pass over the old tags could publish
+        # after the reload and put the old tags back.
+        with self.resolve_lock:
+            self._resolve_all(tags)
+
+    def _resolve_all(self, tags):
+        with self.lock:
+            if tags is None:
+                tags = self.tags
+            old = dict(self.playlists)
+        playlists = {}
+        for key, tag in tags.items():
+            folder = tag.get('folder')
+            if folder is None:
+                continue
+            previous = old.get(key)
+            if previous is not None and previous.folder == folder:
+                if self._tracks(folder) == previous.tracks:
+                    playlists[key] = previous
+                    continue
+            playlists[key] = self.resolve_folder(folder)
+            logging.info(f'Resolved tag {key}: {len(playlists[key].tracks)} tracks in {playlists[key].resolve_ms:.1f} ms')
+        with self.lock:
+            self.tags = dict(tags)
+            self.playlists = playlists
+
+    def get(self, key):
+        with self.lock:
+            return self.playlists.get(key)
+
+    def timings(self):
+        """Per-tag resolution time in ms, as measured at the last resolve"""
+        with self.lock:
+            return {key: playlist.resolve_ms for key, playlist in self.playlists.items()}
@@ -0,0 +1,110 @@
+import sys
+import time
+import queue
+import tracemalloc
+import fakevlc
+import playqueue
+
+# Media list size during a long whole-library shuffle.
+# Usage: python playqueue-bench.py [tracks played]
+#
+# Calls ShuffleQueue.next_item() like flick.py does on every NextItemSet,
+# and next_list() once a list has played out, and checks that no media
+# list grows past the limit. Then plays a shuffle on fakevlc's list
+# player with very short tracks, handing over to a fresh list from a main
+# loop like flick.py's, to check no track is skipped.
+
+WINDOW = 5
+LIMIT = 100
+
+
+class Library(object):
+    """The two library.Library methods ShuffleQueue uses"""
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    def all_track_ids(self):
+        return list(range(self.tracks))
+
+    def track_path(self, track_id):
+        return f'/music/Artist {track_id // 60:04d}/Album {track_id // 12:05d}/{track_id % 12 + 1:02d}.flac'
+
+
+def bounded(played):
+    instance = fakevlc.Instance()
+    shuffle = playqueue.ShuffleQueue(Library(100000), instance.media_new, window=WINDOW, limit=LIMIT)
+    media_list = instance.media_list_new()
+    tracemalloc.start()
+    shuffle.start(media_list)
+    longest = 0
+    lists = 1
+    start = time.perf_counter()
+    for _ in range(played):
+        shuffle.next_item()
+        longest = max(longest, media_list.count())
+        if shuffle.is_played_out():
+            media_list = instance.media_list_new()
+            shuffle.next_list(media_list)
+            lists += 1
+    seconds = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{played} tracks played in {lists} media lists: at most {longest} items each (limit {LIMIT}), '
+          f'{memory / 1024:.0f} KiB traced, next_item {seconds / played * 1e6:.1f} us')
+    return longest <= LIMIT
+
+
+def no_skips(tracks, limit=20):
+    fakevlc.track_seconds = 0.005
+    fakevlc.open_seconds = 0.0
+    instance = fakevlc.Instance()
+    queued = []
+    shuffle = playqueue.ShuffleQueue(Library(100000), instance.media_new, window=WINDOW,
+                                     on_track=queued.append, limit=limit)
+    player = instance.media_list_player_new()
+    played = []
+    events = queue.Queue()
+
+    def on_next_item(event):
+        played.append(player.get_media_player().get_media().path)
+        events.put(event.type)
+
+    player.event_manager().event_attach(fakevlc.EventType.MediaListPlayerNextItemSet, on_next_item)
+    player.event_manager().event_attach(fakevlc.EventType.MediaListPlayerPlayed,
+                                        lambda event: events.put(event.type))
+    media_list = instance.media_list_new()
+    shuffle.start(media_list)
+    player.set_media_list(media_list)
+    player.play()
+    lists = 1
+    end = time.monotonic() + 30
+    while len(played) < tracks and time.monotonic() < end:
+        try:
+            event = events.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if event == fakevlc.EventType.MediaListPlayerNextItemSet:
+            shuffle.next_item()
+        elif event == fakevlc.EventType.MediaListPlayerPlayed and shuffle.is_played_out():
+            media_list = instance.media_list_new()
+            shuffle.next_list(media_list)
+            player.set_media_list(media_list)
+            player.play()
+            lists += 1
+    player.stop()
+    expected = [shuffle.index.track_path(track_id) for track_id in queued[:len(played)]]
+    print(f'{len(played)} tracks through the list player in {lists} media lists, '
+          f'{"none" if played == expected else "some"} skipped')
+    return played == expected and len(played) >= tracks
+
+
+def main():
+    played = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    if not (bounded(played) and no_skips(200)):
+        print('A shuffle media list grew past its limit, or tracks were skipped')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
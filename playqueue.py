@@ -0,0 +1,95 @@
+import random
+import threading
+
+# Windowed whole-library shuffle.
+#
+# Instead of creating a media object for every track up front, the queue
+# keeps a lazily shuffled permutation of library track IDs and only puts
+# the next `window` tracks into the VLC media list. Each time VLC moves to
+# the next item another track is drawn and appended, so starting playback
+# costs the same whatever the size of the library.
+#
+# Played tracks are never removed, libvlc keeps its place in the list by
+# index and would skip a track. Instead a media list takes at most `limit`
+# tracks. Once it has played out, next_list() carries on the same shuffle
+# in a fresh list, so a long shuffle does not keep every played track loaded.
+
+
+class ShuffleQueue(object):
+    def __init__(self, index, media_factory, window=5, on_track=None, limit=100):
+        """media_factory(path) returns a media object, on_track(track_id)
+        is called for every track added to the media list"""
+        self.index = index
+        self.media_factory = media_factory
+        self.window = window
+        self.on_track = on_track
+        self.limit = max(limit, window)
+        self.lock = threading.Lock()
+        self.media_list = None
+        self.order = None
+        self.drawn = 0
+        self.added = 0
+        self.played = 0
+
+    def _draw(self):
+        # One step of a Fisher-Yates shuffle, reshuffling once every track was played
+        if self.order is None or self.drawn >= len(self.order):
+            self.order = self.index.all_track_ids()
+            self.drawn = 0
+            if not self.order:
+                return None
+        pick = random.randrange(self.drawn, len(self.order))
+        order = self.order
+        order[self.drawn], order[pick] = order[pick], order[self.drawn]
+        self.drawn += 1
+        return order[self.drawn - 1]
+
+    def _add(self, count):
+        for _ in range(min(count, self.limit - self.added)):
+            track_id = self._draw()
+            if track_id is None:
+                return
+            self.media_list.add_media(self.media_factory(self.index.track_path(track_id)))
+            self.added += 1
+            if callable(self.on_track):
+                self.on_track(track_id)
+
+    def start(self, media_list):
+        """Start a new shuffle into an empty media list"""
+        with self.lock:
+            self.order = None
+            self._fill(media_list)
+
+    def next_list(self, media_list):
+        """Carry on the shuffle in an empty media list, once is_played_out()"""
+        with self.lock:
+            self._fill(media_list)
+
+    def _fill(self, media_list):
+        self.media_list = media_list
+        self.added = 0
+        self.played = 0
+        self._add(self.window)
+
+    def stop(self):
+        with self.lock:
+            self.media_list = None
+
+    def is_active(self):
+        return self.media_list is not None
+
+    def is_played_out(self):
+        """True when the media list is full and its last track has started"""
+        with self.lock:
+            return self.media_list is not None and self.added >= self.limit and self.played >= self.added
+
+    def next_item(self):
+        """Call when the player moved to the next item, tops the window up"""
+        with self.lock:
+            if self.media_list is None:
+                return
+            self.played += 1
+            # The first NextItemSet is for the first track
+            ahead = self.added - self.played
+            if ahead < self.window:
+                self._add(self.window - ahead)
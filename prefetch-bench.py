@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import statistics
+import prefetch
+
+# Cold vs prefetched start of a track, as VLC sees it when it opens the
+# next file of an album.
+# Usage: python prefetch-bench.py <flac files...>
+#
+# Each file is dropped from the page cache with POSIX_FADV_DONTNEED, then
+# the first READ_BYTES are read straight away (cold) or after Prefetcher
+# had the playing time of a short track to warm it (prefetched). Run it
+# on the Pi against files on the SD card, a fast disk shows little gap.
+
+READ_BYTES = 1024 * 1024
+WARM_TIME = 1.0  # Seconds the "current track" plays before the next one opens
+
+
+def evict(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def open_and_read(path):
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        f.read(READ_BYTES)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        print('usage: python prefetch-bench.py <flac files...>')
+        return
+    prefetcher = prefetch.Prefetcher()
+    cold, warm = [], []
+    for path in paths:
+        evict(path)
+        cold.append(open_and_read(path))
+        evict(path)
+        prefetcher.warm(path)
+        time.sleep(WARM_TIME)
+        warm.append(open_and_read(path))
+    prefetcher.close()
+    for name, times in (('cold', cold), ('prefetched', warm)):
+        print(f'{name:10} first {READ_BYTES // 1024} KiB  p50 {statistics.median(times):7.2f} ms  '
+              f'max {max(times):7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import os
+import time
+import queue
+import logging
+import threading
+from urllib.parse import urlparse, unquote
+
+# Next-track warm-up and inter-track gap measurement.
+#
+# VLC only opens a FLAC file once the previous one has ended, and on an
+# SD card the first reads of a cold file are slow enough to be heard as a
+# gap. While a track plays, Prefetcher asks the kernel to read the start
+# of the next one into the page cache (posix_fadvise WILLNEED, or plain
+# reads where that is not available), so VLC's open and first reads come
+# from memory. GapMeter measures the time from one track reaching its end
+# to the next one playing.
+
+READAHEAD = 16 * 1024 * 1024  # Bytes of the next track to warm, most of a FLAC track
+READ_CHUNK = 256 * 1024
+
+
+def mrl_path(mrl):
+    """File path of a file:// MRL, None for anything else"""
+    if not mrl:
+        return None
+    url = urlparse(mrl)
+    if url.scheme not in ('', 'file'):
+        return None
+    return unquote(url.path)
+
+
+class Prefetcher(object):
+    def __init__(self, readahead=READAHEAD):
+        self.readahead = readahead
+        self.requests = queue.Queue()
+        self.last_path = None
+        self.warmed = 0
+        self.thread = threading.Thread(target=self._run, name='prefetch')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def warm(self, path):
+        """Start reading path into the page cache in the background"""
+        if path:
+            self.requests.put(path)
+
+    def _run(self):
+        while True:
+            path = self.requests.get()
+            if path is None:
+                return
+            if path == self.last_path:
+                continue
+            start = time.perf_counter()
+            try:
+                self._warm_file(path)
+            except OSError as e:
+                logging.error(f'Could not prefetch {path}: {e}')
+                continue
+            self.last_path = path
+            self.warmed += 1
+            logging.debug(f'Prefetched {path} in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    def _warm_file(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, self.readahead, os.POSIX_FADV_WILLNEED)
+                return
+            remaining = self.readahead
+            while remaining > 0:
+                chunk = os.read(fd, min(READ_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self.requests.put(None)
+
+
+class GapMeter(object):
+    """Silence between tracks, from end of one to the next one playing"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.ended = None
+        self.count = 0
+        self.total = 0.0
+        self.last = None
+        self.max = 0.0
+
+    def track_ended(self):
+        with self.lock:
+            self.ended = self.clock()
+
+    def track_started(self):
+        """Returns the gap in seconds, None if no track just ended"""
+        with self.lock:
+            if self.ended is None:
+                return None
+            gap = self.clock() - self.ended
+            self.ended = None
+            self.count += 1
+            self.total += gap
+            self.last = gap
+            self.max = max(self.max, gap)
+            return gap
+
+    def reset(self):
+        # Playback was stopped, the next start is not a track change
+        with self.lock:
+            self.ended = None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __str__(self):
+        return (f'{self.count} gaps, mean {self.mean * 1000:.0f} ms, '
+                f'max {self.max * 1000:.0f} ms, last {(self.last or 0) * 1000:.0f} ms')
@@ -1,86 +1,211 @@
-import board
-import busio
-from adafruit_pn532.i2c import PN532_I2C
-from flask import Flask, render_template, request
+import json
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+import jinja2
+import nfcd
+
+# Tag programming web app.
+#
+# Runs on asyncio, so a phone waiting for a scan no longer holds up the
+# other phones loading the page. Reader calls are blocking socket requests
+# to nfcd and run on one NFC thread. Scans asked for while one is already
+# running share its result. Every scan and write result is also published
+# to /events (server-sent events) and /api/events?since=<id> (long-poll),
+# so every open page sees it. The last HISTORY events are kept, so a client
+# that was busy between two wake-ups still gets every event after its id.
+# An id the server has not reached yet comes from before a restart, and
+# the client gets everything kept since.
+
+templates = jinja2.Environment(loader=jinja2.FileSystemLoader('templates'), autoescape=True)
+
+# The reader belongs to nfcd (run by flick.py, or python nfcd.py on its own)
+reader = nfcd.NfcClient()
+nfc_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='nfc')
 
-app = Flask(__name__)
+last_scanned_uid = None  # Variable to store the last scanned UID
+scan_task = None  # Scan in progress, shared by everyone who asks for one
 
-# Create an I2C object
-i2c = busio.I2C(board.SCL, board.SDA)
+KEEPALIVE = 15  # Seconds between SSE keep-alive comments
+HISTORY = 64    # Recent events kept for clients catching up with since=<id>
 
-# Create the PN532 object
-pn532 = PN532_I2C(i2c, debug=False)
 
-# Configure PN532 to communicate with MiFare cards
-pn532.SAM_configuration()
+class Broadcast(object):
+    """Recent scan/write events, with a way to wait for the next ones"""
 
-last_scanned_uid = None  # Variable to store the last scanned UID
+    def __init__(self, history=HISTORY):
+        self.id = 0
+        self.recent = deque(maxlen=history)
+        self.changed = None  # Created in the running loop, see _changed()
+
+    def _changed(self):
+        # Not at import: before Python 3.10 an asyncio.Event binds to the
+        # loop current when it is created, not the one run_app starts
+        if self.changed is None:
+            self.changed = asyncio.Event()
+        return self.changed
+
+    def publish(self, event):
+        self.id += 1
+        self.recent.append(dict(event, id=self.id))
+        changed, self.changed = self.changed, None
+        if changed is not None:
+            changed.set()
+
+    def since(self, since):
+        return [event for event in self.recent if event['id'] > since]
+
+    async def wait(self, since, timeout):
+        """Every event after since, an empty list if nothing happened within timeout"""
+        if since > self.id:
+            since = 0  # An id from before a restart, ids start over from 1
+        if self.id <= since:
+            try:
+                await asyncio.wait_for(self._changed().wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return self.since(since)
+
+
+events = Broadcast()
+
+
+def render(name, **context):
+    return web.Response(text=templates.get_template(name).render(**context), content_type='text/html')
+
+
+def error_page(error_message):
+    print(error_message)
+    return render('error.html', error_message=error_message)
 
-@app.route('/')
-def index():
-    return render_template('index.html', last_scanned_uid=last_scanned_uid)
 
-@app.route('/scan', methods=['POST'])
-def scan():
+async def run_nfc(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(nfc_executor, fn, *args)
+
+
+async def _scan():
+    global last_scanned_uid
+    try:
+        uid = await run_nfc(reader.scan, 0.5)
+    except nfcd.NfcError as e:
+        events.publish({'type': 'scan', 'error': str(e)})
+        return None, str(e)
+    print("Found card with UID:", [hex(i) for i in uid])
+    last_scanned_uid = uid
+    events.publish({'type': 'scan', 'uid': uid.hex()})
+    return uid, None
+
+
+def start_scan():
+    global scan_task
+    if scan_task is None or scan_task.done():
+        scan_task = asyncio.ensure_future(_scan())
+    return scan_task
+
+
+async def write_tag(data_to_write):
+    # Only changed pages are written, then read back to verify
     try:
-        global last_scanned_uid
+        result = await run_nfc(reader.write_payload, data_to_write, last_scanned_uid, 2.0)
+    except nfcd.NfcError as e:
+        events.publish({'type': 'write', 'error': str(e)})
+        raise
+    print("Data written to the last scanned card:", data_to_write,
+          f"({result['written']}/{result['pages']} pages written)")
+    events.publish(dict(result, type='write', payload=data_to_write))
+    return result
+
 
-        # Check if a card is available to read
-        uid = pn532.read_passive_target(timeout=0.5)
+# HTML pages
 
-        if uid is not None:
-            print("Found card with UID:", [hex(i) for i in uid])
-            last_scanned_uid = uid
+async def index(request):
+    return render('index.html', last_scanned_uid=last_scanned_uid)
 
-            return render_template('index.html', last_scanned_uid=last_scanned_uid)
 
-        else:
-            error_message = "Error: No NFC card found. Please try again."
-            print(error_message)
-            return render_template('error.html', error_message=error_message)
+async def scan(request):
+    uid, error = await asyncio.shield(start_scan())
+    if uid is None:
+        return error_page(f"Error: {error}")
+    return render('index.html', last_scanned_uid=last_scanned_uid)
 
-    except Exception as e:
-        error_message = f"Error: {e}"
-        print(error_message)
-        return render_template('error.html', error_message=error_message)
 
-@app.route('/write', methods=['POST'])
-def write():
+async def write(request):
+    if last_scanned_uid is None:
+        return error_page("Error: No NFC card scanned. Please scan an NFC card first.")
+    form = await request.post()
+    data_to_write = form.get('data_to_write')
+    if not data_to_write:
+        return error_page("Error: Nothing to write.")
     try:
-        global last_scanned_uid
+        await write_tag(data_to_write)
+    except nfcd.NfcError as e:
+        return error_page(f"Error: {e}")
+    return render('success.html', data_written=data_to_write)
+
 
-        if last_scanned_uid is not None:
-            # Get data from the web form
-            data_to_write = request.form['data_to_write']
+# JSON API, results arrive through /api/events or /events
 
-            # Convert the string to bytes (UTF-8 encoding)
-            data_bytes = data_to_write.encode('utf-8')
+async def api_scan(request):
+    start_scan()
+    return web.json_response({'id': events.id}, status=202)
 
-            # Write data to the last scanned card, 4 bytes per block
-            block_number = 4  # Start writing from block 4
-            for start_index in range(0, len(data_bytes), 4):
-                end_index = start_index + 4
-                block_data = data_bytes[start_index:end_index]
 
-                # Ensure the block_data is 4 bytes long by padding if necessary
-                block_data += b'\0' * (4 - len(block_data))
+async def api_write(request):
+    if last_scanned_uid is None:
+        return web.json_response({'error': 'No NFC card scanned'}, status=409)
+    form = await request.post()
+    if not form.get('data_to_write'):
+        return web.json_response({'error': 'Nothing to write'}, status=400)
+    try:
+        result = await write_tag(form['data_to_write'])
+    except nfcd.NfcError as e:
+        return web.json_response({'error': str(e)}, status=409)
+    return web.json_response(result)
 
-                pn532.ntag2xx_write_block(block_number, block_data)
-                block_number += 1
 
-            print("Data written to the last scanned card:", data_to_write)
+async def api_events(request):
+    try:
+        since = int(request.query.get('since', 0))
+        timeout = min(float(request.query.get('timeout', 25)), 60)
+    except ValueError:
+        return web.json_response({'error': 'since must be an event id and timeout a number'}, status=400)
+    pending = await events.wait(since, timeout)
+    if not pending:
+        return web.Response(status=204)
+    return web.json_response({'id': pending[-1]['id'], 'events': pending})
 
-            return render_template('success.html', data_written=data_to_write)
 
-        else:
-            error_message = "Error: No NFC card scanned. Please scan an NFC card first."
-            print(error_message)
-            return render_template('error.html', error_message=error_message)
+async def event_stream(request):
+    try:
+        since = int(request.headers.get('Last-Event-ID', events.id))
+    except ValueError:
+        return web.json_response({'error': 'Last-Event-ID must be an event id'}, status=400)
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+    await response.prepare(request)
+    while True:
+        pending = await events.wait(since, KEEPALIVE)
+        if not pending:
+            await response.write(b': keep-alive\n\n')
+            continue
+        for event in pending:
+            since = event['id']
+            await response.write(f"id: {since}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n".encode('utf-8'))
+
+
+def make_app():
+    app = web.Application()
+    app.add_routes([
+        web.get('/', index),
+        web.post('/scan', scan),
+        web.post('/write', write),
+        web.post('/api/scan', api_scan),
+        web.post('/api/write', api_write),
+        web.get('/api/events', api_events),
+        web.get('/events', event_stream),
+    ])
+    return app
 
-    except Exception as e:
-        error_message = f"Error: {e}"
-        print(error_message)
-        return render_template('error.html', error_message=error_message)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=True)
+    web.run_app(make_app(), host='0.0.0.0', port=5000)
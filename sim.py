@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import types
+import struct
+import hashlib
+import logging
+import tempfile
+import importlib
+import threading
+import mockgpio
+import fakepn532
+import fakemgc3130
+import fakevlc
+import i2c
+
+# Runs the whole flick.py stack on any Linux box.
+#
+# Simulation installs stand-ins for the hardware modules flick.py imports
+# (RPi.GPIO -> mockgpio, board/busio/adafruit_pn532 -> fakepn532, vlc ->
+# fakevlc, the Flick board's I2C bus -> fakemgc3130, bluetoothctl ->
+# btpower.FakeAdapter), writes a config.json and a synthetic FLAC library
+# to a temporary folder, and imports flick.py there on a background
+# thread. A timeline of (seconds, action, *args) steps then drives it:
+#
+#   (0.5, 'tap', 'tag3')           put a tag with this payload on the reader
+#   (1.0, 'remove')                take it off again
+#   (2.0, 'switch', 'nfc', False)  flip a switch
+#   (3.0, 'flick', 'west', 'east') swipe over the Flick board
+#   (4.0, 'bluetooth', True)       power the adapter from outside flick.py
+#
+# Everything that happens is recorded in Simulation.events as
+# (seconds, kind, detail), with tap-to-audio latencies worked out by
+# tap_latencies(). flick.py can only be imported once per process, run
+# one simulation per process.
+
+SWITCH_PINS = {'bluetooth': 25, 'nfc': 24}
+SAMPLE_RATE = 44100
+
+
+def make_flac(path, track=None, disc=None, seconds=180, title=None, padding=0):
+    """A FLAC file with STREAMINFO, a Vorbis comment and no audio"""
+    streaminfo = bytearray(34)
+    streaminfo[10:18] = struct.pack('>Q', SAMPLE_RATE << 44 | 1 << 41 | 15 << 36 | SAMPLE_RATE * seconds)
+    comments = [f'TITLE={title or os.path.basename(path)}']
+    if track is not None:
+        comments.append(f'TRACKNUMBER={track}')
+    if disc is not None:
+        comments.append(f'DISCNUMBER={disc}')
+    vorbis = struct.pack('<I', 3) + b'sim' + struct.pack('<I', len(comments))
+    for comment in comments:
+        comment = comment.encode('utf-8')
+        vorbis += struct.pack('<I', len(comment)) + comment
+    blocks = [(0, bytes(streaminfo)), (4, vorbis), (1, bytes(padding))]
+    with open(path, 'wb') as f:
+        f.write(b'fLaC')
+        for n, (block_type, data) in enumerate(blocks):
+            last = n == len(blocks) - 1
+            f.write(struct.pack('>I', last << 31 | block_type << 24 | len(data)))
+            f.write(data)
+
+
+def make_library(root, tracks, tracks_per_album=12, albums_per_artist=5):
+    """Synthetic library of `tracks` FLAC files, returns the album folders"""
+    albums = []
+    for n in range(tracks):
+        album_no = n // tracks_per_album
+        album = os.path.join(f'Artist {album_no // albums_per_artist:04d}', f'Album {album_no:05d}') + '/'
+        if n % tracks_per_album == 0:
+            os.makedirs(os.path.join(root, album))
+            albums.append(album)
+        track = n % tracks_per_album + 1
+        # Written out of order on purpose, the tags hold the real order
+        make_flac(os.path.join(root, album, f'Track {(track * 7) % tracks_per_album:02d}.flac'), track=track)
+    return albums
+
+
+def tag_uid(payload):
+    """Stable 7 byte NTAG UID for a payload"""
+    return b'\x04' + hashlib.sha1(payload.encode('utf-8')).digest()[:6]
+
+
+class Simulation(object):
+    def __init__(self, tracks=120, tags=None, track_seconds=2.0, pn532_latency=0.002,
+                 irq=False, root=None, tag_count=3):
+        """tags maps tag keys to album folders, by default the first
+        tag_count albums get the keys '1', '2', 'tag3', 'tag4', ..."""
+        self.root = root or tempfile.mkdtemp(prefix='flick-sim-')
+        self.audio_folder = os.path.join(self.root, 'Music') + '/'
+        self.track_seconds = track_seconds
+        self.pn532_latency = pn532_latency
+        self.irq = irq
+        self.tracks = tracks
+        self.tags = tags
+        self.tag_count = tag_count
+        self.lock = threading.Lock()
+        self.events = []
+        self.start = None
+        self.flick = None
+
+        self.gpio = mockgpio.MockGPIO()
+        self.pn532 = fakepn532.FakePN532(self.gpio, 16 if irq else None, latency=pn532_latency)
+        self.mgc3130 = fakemgc3130.FakeMGC3130(self.gpio)
+        self.adapter = None
+
+    def record(self, kind, detail=None):
+        with self.lock:
+            self.events.append((time.monotonic() - self.start, kind, detail))
+
+    def _write_config(self):
+        if not os.path.exists(self.audio_folder):
+            albums = make_library(self.audio_folder, self.tracks)
+        else:
+            albums = sorted(os.path.relpath(dirpath, self.audio_folder) + '/'
+                            for dirpath, dirnames, filenames in os.walk(self.audio_folder)
+                            if any(name.endswith('.flac') for name in filenames))
+        if self.tags is None:
+            keys = ['1', '2'] + [f'tag{n}' for n in range(3, self.tag_count + 1)]
+            self.tags = dict(zip(keys[:self.tag_count], albums))
+        config = {
+            'global_config': {
+                'audio_folder': self.audio_folder,
+                'enable_logging': True,
+                'nfcd_socket': os.path.join(self.root, 'nfcd.sock'),
+            },
+            'tags': {key: {'folder': folder} for key, folder in self.tags.items()},
+        }
+        if self.irq:
+            config['global_config']['pn532_irq_pin'] = 16
+        with open(os.path.join(self.root, 'config.json'), 'w') as config_file:
+            json.dump(config, config_file, indent=4)
+
+    def _install(self):
+        rpi = types.ModuleType('RPi')
+        rpi.GPIO = self.gpio
+        sys.modules['RPi'] = rpi
+        sys.modules['RPi.GPIO'] = self.gpio
+
+        board = types.ModuleType('board')
+        board.SCL, board.SDA = 3, 2
+        busio = types.ModuleType('busio')
+        busio.I2C = _FakeI2CBus
+        sys.modules['board'] = board
+        sys.modules['busio'] = busio
+
+        pn532 = self.pn532
+        adafruit_pn532 = types.ModuleType('adafruit_pn532')
+        adafruit_i2c = types.ModuleType('adafruit_pn532.i2c')
+        adafruit_i2c.PN532_I2C = lambda *args, **kwargs: pn532
+        adafruit_pn532.i2c = adafruit_i2c
+        sys.modules['adafruit_pn532'] = adafruit_pn532
+        sys.modules['adafruit_pn532.i2c'] = adafruit_i2c
+
+        fakevlc.track_seconds = self.track_seconds
+        fakevlc.on_event = self.record
+        sys.modules['vlc'] = fakevlc
+
+        mgc3130 = self.mgc3130
+        i2c.I2CMaster = lambda *args, **kwargs: mgc3130
+        mgc3130.firmware_ready()
+
+        import btpower
+        self.adapter = btpower.FakeAdapter(powered=True)
+        btpower.open_adapter = lambda: self.adapter
+
+    def boot(self, timeout=30):
+        """Import flick.py in the simulated world, returns once it is running"""
+        self._write_config()
+        self._install()
+        for name, pin in SWITCH_PINS.items():
+            self.gpio.set_input(pin, mockgpio.HIGH)  # Both switches on
+        self.start = time.monotonic()
+        here = os.path.dirname(os.path.abspath(__file__))
+        if here not in sys.path:
+            sys.path.insert(0, here)  # flick.py is imported after the chdir
+        os.chdir(self.root)
+        logging.getLogger().handlers = []
+
+        thread = threading.Thread(target=self._run_flick, name='flick')
+        thread.daemon = True
+        thread.start()
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            flick = sys.modules.get('flick')
+            if flick is not None and hasattr(flick, 'tag_scanning_thread'):
+                self.flick = flick
+                self.record('booted')
+                return flick
+            time.sleep(0.01)
+        raise RuntimeError('flick.py did not start')
+
+    def _run_flick(self):
+        try:
+            importlib.import_module('flick')
+        except BaseException as e:
+            self.record('crashed', repr(e))
+            raise
+
+    # Timeline actions
+
+    def tap(self, payload):
+        tag = fakepn532.FakeTag(tag_uid(payload), payload.encode('utf-8') + b'\x00')
+        self.record('tap', payload)
+        self.pn532.place(tag)
+
+    def remove(self):
+        self.record('remove')
+        self.pn532.remove()
+
+    def switch(self, name, state):
+        self.record('switch', (name, state))
+        self.gpio.set_input(SWITCH_PINS[name], mockgpio.HIGH if state else mockgpio.LOW)
+
+    def bluetooth(self, powered):
+        self.record('bluetooth', powered)
+        self.adapter.external_change(powered)
+
+    def flick_gesture(self, start, finish):
+        self.record('flick', (start, finish))
+        self.mgc3130.flick(start, finish)
+
+    def run(self, timeline, until=None):
+        """Play a timeline of (seconds since boot, action, *args) steps"""
+        actions = {'tap': self.tap, 'remove': self.remove, 'switch': self.switch,
+                   'flick': self.flick_gesture, 'bluetooth': self.bluetooth}
+        for step in sorted(timeline, key=lambda step: step[0]):
+            at, action, args = step[0], step[1], step[2:]
+            delay = self.start + at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if action != 'wait':
+                actions[action](*args)
+        if until is not None:
+            delay = self.start + until - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    # Results
+
+    def tap_latencies(self):
+        """(payload, seconds from tap to the first track of its album playing)"""
+        folders = {key: os.path.join(self.audio_folder, folder) for key, folder in self.tags.items()}
+        results = []
+        with self.lock:
+            events = list(self.events)
+        for n, (at, kind, detail) in enumerate(events):
+            if kind != 'tap':
+                continue
+            folder = folders.get(detail)
+            for later, later_kind, later_detail in events[n + 1:]:
+                if later_kind == 'tap':
+                    break
+                if later_kind == 'playing' and (folder is None or later_detail.startswith(folder)):
+                    results.append((detail, later - at))
+                    break
+            else:
+                results.append((detail, None))
+        return results
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump([{'t': round(at, 6), 'kind': kind, 'detail': detail} for at, kind, detail in self.events],
+                      f, indent=1)
+
+
+class _FakeI2CBus(object):
+    def __init__(self, scl=None, sda=None, frequency=100000):
+        pass
+
+    def deinit(self):
+        pass
@@ -0,0 +1,57 @@
+import sys
+import time
+import random
+import threading
+import statistics
+import mockgpio
+import switches
+
+# Switch response latency with the mock GPIO backend.
+# Usage: python switch-bench.py [flips]
+#
+# Flips the NFC switch through mockgpio, with a burst of contact bounce
+# on every flip, and measures the time until the Switches listener runs.
+# Also checks that each bouncy flip is reported exactly once.
+
+PIN = 24
+
+
+def main():
+    flips = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    gpio = mockgpio.MockGPIO()
+    state = switches.Switches(gpio, {'nfc': PIN})
+    notified = []
+    done = threading.Event()
+
+    def listener(value):
+        notified.append((time.monotonic(), value))
+        done.set()
+
+    state.add_listener('nfc', listener)
+
+    latencies = []
+    level = False
+    for _ in range(flips):
+        level = not level
+        done.clear()
+        flipped = time.monotonic()
+        # Contact bounce: a few fast toggles before the level settles
+        for _ in range(random.randint(1, 4)):
+            gpio.set_input(PIN, level)
+            time.sleep(0.002)
+            gpio.set_input(PIN, not level)
+            time.sleep(0.002)
+        gpio.set_input(PIN, level)
+        if done.wait(1):
+            latencies.append((notified[-1][0] - flipped) * 1000)
+        time.sleep(0.05)
+
+    state.close()
+    print(f'flips {flips}, notifications {len(notified)}, '
+          f'wrong states {sum(1 for i, (_, v) in enumerate(notified) if v != (i % 2 == 0))}')
+    print(f'edge-triggered latency p50 {statistics.median(latencies):.1f} ms, max {max(latencies):.1f} ms')
+    print('old polling loops: up to 1000 ms (scan loop) and 2000 ms (main loop with delays)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import time
+import logging
+import threading
+
+# Edge-triggered state for the external switches.
+#
+# Each switch gets a GPIO edge callback instead of being polled. An edge
+# only (re)starts a short settle timer; when it runs out the pin is read
+# once more and listeners are told if the level really changed, so
+# contact bounce never reaches them. Everything that cares about a switch
+# reads or waits on this one object.
+
+
+class Switches(object):
+    def __init__(self, gpio, pins, settle=0.03, bouncetime=10):
+        """pins maps a switch name to its BCM pin, e.g. {'nfc': 24}"""
+        self.gpio = gpio
+        self.pins = dict(pins)
+        self.settle = settle
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.states = {}
+        self.timers = {}
+        self.listeners = {name: [] for name in pins}
+        self.last_change = {}
+        for name, pin in self.pins.items():
+            gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+            self.states[name] = gpio.input(pin) == gpio.HIGH
+            gpio.add_event_detect(pin, gpio.BOTH, callback=self._make_edge_handler(name),
+                                  bouncetime=bouncetime)
+
+    def _make_edge_handler(self, name):
+        def on_edge(channel):
+            with self.lock:
+                timer = self.timers.get(name)
+                if timer is not None:
+                    timer.cancel()
+                timer = threading.Timer(self.settle, self._settled, (name,))
+                timer.daemon = True
+                self.timers[name] = timer
+            timer.start()
+        return on_edge
+
+    def _settled(self, name):
+        state = self.gpio.input(self.pins[name]) == self.gpio.HIGH
+        with self.lock:
+            self.timers.pop(name, None)
+            if state == self.states[name]:
+                return
+            self.states[name] = state
+            self.last_change[name] = time.monotonic()
+            self.changed.notify_all()
+            listeners = list(self.listeners[name])
+        logging.info(f"Switch {name} turned {'on' if state else 'off'}")
+        for listener in listeners:
+            try:
+                listener(state)
+            except Exception as e:
+                logging.error(f'Error in {name} switch listener: {e}')
+
+    def get(self, name):
+        with self.lock:
+            return self.states[name]
+
+    def add_listener(self, name, listener):
+        """Call listener(state) from the debounce thread whenever name changes"""
+        with self.lock:
+            self.listeners[name].append(listener)
+
+    def wait_for(self, name, state, timeout=None):
+        """Block until switch name is in state, returns False on timeout"""
+        with self.lock:
+            return self.changed.wait_for(lambda: self.states[name] == state, timeout)
+
+    def close(self):
+        with self.lock:
+            for timer in self.timers.values():
+                timer.cancel()
+            self.timers.clear()
+        for pin in self.pins.values():
+            self.gpio.remove_event_detect(pin)
@@ -0,0 +1,38 @@
+import time
+import threading
+
+# Per-tag debouncing for the tag reader.
+#
+# A tag lying on the reader is seen on every poll. Rather than sleeping
+# after each tap we remember when every UID was last seen and drop reads
+# of the same UID until it has been out of the field for hold_time
+# seconds. A different tag is always let through straight away.
+
+
+class TagDebouncer(object):
+    def __init__(self, hold_time=2.0, clock=time.monotonic):
+        self.hold_time = hold_time
+        self.clock = clock
+        self.last_seen = {}
+        self.lock = threading.Lock()
+
+    def accept(self, uid):
+        """True if this read of uid is a new tap, False if it is a repeat"""
+        now = self.clock()
+        with self.lock:
+            last = self.last_seen.get(uid)
+            self.last_seen[uid] = now
+            if len(self.last_seen) > 64:
+                # Forget tags that have long left the field
+                for key, seen in list(self.last_seen.items()):
+                    if now - seen >= self.hold_time:
+                        del self.last_seen[key]
+        return last is None or now - last >= self.hold_time
+
+    def forget(self, uid=None):
+        """Make the next read of uid (or of every tag) count as a new tap"""
+        with self.lock:
+            if uid is None:
+                self.last_seen.clear()
+            else:
+                self.last_seen.pop(uid, None)
@@ -0,0 +1,117 @@
+import os
+import json
+import logging
+import threading
+
+# Persistent map from tag UIDs to the tag key written on the tag.
+#
+# The first time a tag's payload is read it is learned here and saved next
+# to config.json, so from then on a tap resolves from the UID that
+# read_passive_target already returned, without reading tag memory. UIDs
+# are stored as upper case hex without separators. Writers that change a
+# tag's payload must learn() the new payload (or forget() the UID), the
+# file is reloaded when another process changes it.
+
+INDEX_NAME = 'tag_uids.json'
+
+
+UID_PREFIX = 'uid:'
+
+
+def uid_hex(uid):
+    """'04A1B2C3D4E580' for a UID given as bytes or as a hex string"""
+    if isinstance(uid, str):
+        if uid[:len(UID_PREFIX)].lower() == UID_PREFIX:
+            uid = uid[len(UID_PREFIX):]
+        return uid.replace(':', '').replace(' ', '').replace('-', '').upper()
+    return bytes(uid).hex().upper()
+
+
+def is_uid(key):
+    """True for config keys marked as a raw 4, 7 or 10 byte UID
+
+    A key has to say it is a UID, "uid:04A1B2C3D4E580" or
+    "04:A1:B2:C3:D4:E5:80", so a payload such as "deadbeef" or "12345678"
+    is still read from the tag.
+    """
+    if key[:len(UID_PREFIX)].lower() == UID_PREFIX:
+        key = key[len(UID_PREFIX):]
+    elif ':' not in key or any(len(part) != 2 for part in key.split(':')):
+        return False
+    key = uid_hex(key)
+    if len(key) not in (8, 14, 20):
+        return False
+    try:
+        bytes.fromhex(key)
+    except ValueError:
+        return False
+    return True
+
+
+def index_path(config_path):
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), INDEX_NAME)
+
+
+class TagIndex(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.uids = {}
+        self.mtime = None
+
+    def _reload(self):
+        # Caller holds self.lock
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self.mtime:
+            return
+        try:
+            with open(self.path, 'r') as index_file:
+                self.uids = json.load(index_file)
+            self.mtime = mtime
+        except (OSError, ValueError) as e:
+            logging.error(f'Could not load tag index {self.path}: {e}')
+
+    def _save(self):
+        # Caller holds self.lock
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as index_file:
+                json.dump(self.uids, index_file, indent=4, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logging.error(f'Could not save tag index {self.path}: {e}')
+
+    def get(self, uid):
+        """Tag key learned for this UID, None if the tag was never read"""
+        with self.lock:
+            self._reload()
+            return self.uids.get(uid_hex(uid))
+
+    def learn(self, uid, key):
+        with self.lock:
+            self._reload()
+            uid = uid_hex(uid)
+            if self.uids.get(uid) == key:
+                return
+            self.uids[uid] = key
+            self._save()
+
+    def forget(self, uid):
+        with self.lock:
+            self._reload()
+            if self.uids.pop(uid_hex(uid), None) is not None:
+                self._save()
+
+    def __len__(self):
+        return len(self.uids)
+
+
+def open_index(config_path):
+    index = TagIndex(index_path(config_path))
+    with index.lock:
+        index._reload()
+    return index
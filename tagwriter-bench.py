@@ -0,0 +1,60 @@
+import sys
+import logging
+import fakepn532
+import ntag
+import tagwriter
+
+# TagWriter against a simulated NTAG215.
+# Usage: python tagwriter-bench.py
+#
+# Writes a short album key, a long one and the same long one again, and
+# reads each back with ntag.TagReader. Then tries a key longer than the
+# tag's user memory, which must be refused without writing a single page.
+# Exits 1 if anything reads back wrong or the oversized key touched the tag.
+
+UID = bytes.fromhex('04010203040506')
+I2C_LATENCY = 0.0005  # Roughly one short PN532 frame at 100 kHz
+KEYS = ['Stray Kids/NOEASY/', 'Various Artists/' + 'A Very Long Compilation Title ' * 6 + '/']
+
+
+def pages_changed(before, after):
+    return sum(before[offset:offset + 4] != after[offset:offset + 4] for offset in range(0, len(before), 4))
+
+
+def main():
+    logging.disable(logging.INFO)
+    pn532 = fakepn532.FakePN532(latency=I2C_LATENCY)
+    tag = fakepn532.FakeTag(UID)
+    pn532.place(tag)
+    writer = tagwriter.TagWriter(pn532)
+    ok = True
+
+    for text in KEYS + KEYS[-1:]:
+        result = writer.write_payload(UID, text)
+        read_back = ntag.TagReader(pn532).read_payload(UID)
+        print(f'{len(tagwriter.encode(text)):4} bytes  {result}')
+        if read_back != text:
+            print(f'    read back {read_back!r}')
+            ok = False
+
+    capacity = ntag.user_bytes(tag.memory[12:16])
+    text = 'x' * capacity
+    before = bytes(tag.memory)
+    try:
+        writer.write_payload(UID, text)
+        print(f'{len(tagwriter.encode(text)):4} bytes  written, the tag holds {capacity}')
+        ok = False
+    except tagwriter.TagWriteError:
+        print(f'{len(tagwriter.encode(text)):4} bytes  refused by the {capacity} byte tag')
+    changed = pages_changed(before, bytes(tag.memory))
+    print(f'           {changed} pages changed by the oversized key')
+    if changed:
+        ok = False
+
+    if not ok:
+        print('A key was not written correctly, or an oversized key was written')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import time
+import logging
+import ntag
+
+# Writes tag keys to NTAG21x tags for server.py, write-web.py and write.py.
+#
+# The payload is written as plain text from page 4 on, ended by a NUL, the
+# format ntag.decode_payload reads. The pages the payload covers are read
+# first (FAST_READ where the tag supports it) and only pages whose content
+# changes are written, NTAG WRITE can only program one page at a time. The
+# written range is then verified with one 16 byte READ per four pages.
+#
+# If page 4 changes along with other pages it is cleared first and written
+# last. A tag pulled away halfway then reads as empty instead of as a mix
+# of the old and the new key.
+#
+# The capability container (page 3) is read along with the payload pages,
+# and a payload longer than the user memory it gives is refused before
+# anything is written. On an NTAG215 the pages after user memory are the
+# lock and configuration pages.
+
+NTAG_WRITE = 0xA2
+
+
+class TagWriteError(Exception):
+    pass
+
+
+class WriteResult(object):
+    def __init__(self, payload, pages, written, transactions, seconds):
+        self.payload = payload
+        self.pages = pages                # Pages covered by the payload
+        self.written = written            # Pages actually written
+        self.transactions = transactions
+        self.seconds = seconds
+
+    @property
+    def skipped(self):
+        return self.pages - self.written
+
+    @property
+    def bytes_per_second(self):
+        return self.pages * 4 / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f'{self.written}/{self.pages} pages written, {self.transactions} transactions, '
+                f'{self.seconds * 1000:.0f} ms ({self.bytes_per_second:.0f} bytes/s)')
+
+
+def encode(text):
+    """Payload bytes for text: UTF-8, a NUL and padding to whole pages"""
+    data = text.encode('utf-8') + b'\x00'
+    return data + b'\x00' * (-len(data) % 4)
+
+
+def plan_writes(current, data, first_page=ntag.USER_START_PAGE):
+    """(page, 4 bytes) for every page of data that differs from current"""
+    writes = []
+    for offset in range(0, len(data), 4):
+        page_data = bytes(data[offset:offset + 4])
+        if bytes(current[offset:offset + 4]) != page_data:
+            writes.append((first_page + offset // 4, page_data))
+    return writes
+
+
+class TagWriter(object):
+    def __init__(self, pn532, reader=None, index=None):
+        self.pn532 = pn532
+        self.reader = reader or ntag.TagReader(pn532)
+        self.index = index  # tagindex.TagIndex to keep up to date, optional
+        self.transactions = 0
+
+    def write_payload(self, uid, text):
+        """Write text to the tag that was just detected, returns a WriteResult
+
+        Raises TagWriteError if the tag can't be read, written or verified.
+        """
+        start = time.monotonic()
+        reads = self.reader.transactions
+        self.transactions = 0
+        data = encode(text)
+        first = ntag.USER_START_PAGE
+        last = first + len(data) // 4 - 1
+
+        # The capability container and the first payload pages in one read,
+        # never past page 34 before the tag's size is known
+        head = min(last, ntag.CC_PAGE + ntag.FAST_READ_PAGES - 1)
+        current = self.reader.read_pages(ntag.CC_PAGE, head)
+        if current is None:
+            raise TagWriteError('Could not read the tag, hold it still and try again')
+        capacity = ntag.user_bytes(current[0:4])
+        if len(data) > capacity:
+            raise TagWriteError(f'"{text}" needs {len(data)} bytes, the tag holds {capacity}')
+        current = current[4:]
+        if head < last:
+            rest = self.reader.read_pages(head + 1, last)
+            if rest is None:
+                raise TagWriteError('Could not read the tag, hold it still and try again')
+            current += rest
+        writes = plan_writes(current, data, first)
+
+        if len(writes) > 1 and writes[0][0] == first:
+            # Invalidate the old key first, then write page 4 last
+            self._write_page(first, b'\x00\x00\x00\x00')
+            writes = writes[1:] + writes[:1]
+        for page, page_data in writes:
+            self._write_page(page, page_data)
+        if writes:
+            self._verify(writes, data, first)
+
+        self.reader.forget(uid)
+        if self.index is not None:
+            self.index.learn(uid, text)
+        result = WriteResult(text, len(data) // 4, len(writes),
+                             self.transactions + self.reader.transactions - reads,
+                             time.monotonic() - start)
+        logging.info(f'Wrote "{text}" to tag {bytes(uid).hex()}: {result}')
+        return result
+
+    def _write_page(self, page, page_data):
+        self.transactions += 1
+        try:
+            ok = self.pn532.ntag2xx_write_block(page, page_data)
+        except RuntimeError as e:
+            raise TagWriteError(f'Writing page {page} failed: {e}')
+        if not ok:
+            raise TagWriteError(f'Writing page {page} failed, the tag may be locked or was removed')
+
+    def _verify(self, writes, data, first):
+        # One READ returns four pages, so read each group of four pages once
+        for group in sorted({(page - first) // 4 for page, _ in writes}):
+            page = first + group * 4
+            self.transactions += 1
+            try:
+                block = self.pn532.mifare_classic_read_block(page)
+            except RuntimeError as e:
+                raise TagWriteError(f'Verifying page {page} failed: {e}')
+            expected = data[group * 16:group * 16 + 16]
+            if block is None or bytes(block[:len(expected)]) != expected:
+                raise TagWriteError(f'Verifying page {page} failed, the tag was removed during the write')
@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import platform
+import threading
+import subprocess
+import statistics
+import sim
+
+# End-to-end tap-to-audio benchmark on simulated hardware.
+# Usage: python tap-bench.py [--sizes 1000 10000 100000] [--taps 40] [--out results.json]
+#                            [--compare previous.json]
+#
+# For every library size a child process builds a synthetic FLAC library,
+# boots flick.py in sim.Simulation and taps configured tags one after the
+# other. Each tap is split into stages from timestamps taken around the
+# functions on the path:
+#
+#   detect   tag placed -> tag_detector returns its UID
+#   read     UID -> scan_tag returns the tag key (UID index or tag memory)
+#   queue    scan_tag -> handle_new_tag starts on the playback worker
+#   handle   handle_new_tag -> play_album
+#   build    play_album -> player.play() (media list construction)
+#   start    player.play() -> the first track playing
+#   total    tag placed -> the first track playing
+#
+# music_library.files_under on a configured album and the cold boot
+# time are measured as well. p50/p95/p99 per stage are printed and can be
+# written as JSON, --compare prints the change against an earlier run.
+
+STAGES = ('detect', 'read', 'queue', 'handle', 'build', 'start', 'total')
+MARKS = ('tap', 'uid', 'payload', 'handle', 'album', 'play', 'playing')
+
+
+def percentile(values, p):
+    # Nearest rank
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100.0 * len(values) + 0.5)) - 1))]
+
+
+def summarize(values):
+    values = [v * 1000 for v in values]
+    if not values:
+        return {'n': 0}
+    return {'n': len(values), 'p50': statistics.median(values), 'p95': percentile(values, 95),
+            'p99': percentile(values, 99), 'max': max(values)}
+
+
+class TapProbe(object):
+    """Timestamps the functions on the tap path of a running flick.py"""
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.marks = {}
+        self.done = None
+        flick = simulation.flick
+
+        def first(name):
+            self.marks.setdefault(name, time.monotonic())
+
+        wait_for_tag = flick.tag_detector.wait_for_tag
+
+        def timed_wait_for_tag(*args, **kwargs):
+            uid = wait_for_tag(*args, **kwargs)
+            if uid is not None:
+                first('uid')
+            return uid
+        flick.tag_detector.wait_for_tag = timed_wait_for_tag
+
+        # flick.py looks these up as globals on every call
+        for function, mark, on_return in ((flick.scan_tag, 'payload', True),
+                                          (flick.handle_new_tag, 'handle', False),
+                                          (flick.play_album, 'album', False)):
+            setattr(flick, function.__name__, self._wrap(function, mark, on_return, first))
+
+        record = simulation.record
+
+        def on_event(kind, detail=None):
+            record(kind, detail)
+            if kind == 'play':
+                self.marks['play'] = time.monotonic()  # The last play() before audio
+            elif kind == 'playing' and 'tap' in self.marks and 'playing' not in self.marks:
+                first('playing')
+                if self.done is not None:
+                    self.done()
+        sim.fakevlc.on_event = on_event
+
+    def _wrap(self, function, mark, on_return, first):
+        def timed(*args, **kwargs):
+            if not on_return:
+                first(mark)
+            result = function(*args, **kwargs)
+            if on_return and result:
+                first(mark)
+            return result
+        timed.__name__ = function.__name__
+        return timed
+
+    def stages(self):
+        m = self.marks
+        if any(mark not in m for mark in MARKS):
+            return None
+        return {
+            'detect': m['uid'] - m['tap'],
+            'read': m['payload'] - m['uid'],
+            'queue': m['handle'] - m['payload'],
+            'handle': m['album'] - m['handle'],
+            'build': m['play'] - m['album'],
+            'start': m['playing'] - m['play'],
+            'total': m['playing'] - m['tap'],
+        }
+
+
+def run_child(tracks, taps, irq):
+    build_start = time.monotonic()
+    simulation = sim.Simulation(tracks=tracks, track_seconds=30.0, irq=irq, tag_count=8)
+    simulation._write_config()
+    build_seconds = time.monotonic() - build_start
+    simulation._write_config = lambda: None
+    flick = simulation.boot(timeout=600)
+    boot_seconds = next(at for at, kind, detail in simulation.events if kind == 'booted')
+
+    probe = TapProbe(simulation)
+    played = threading.Event()
+    probe.done = played.set
+    keys = list(simulation.tags)
+    results = {stage: [] for stage in STAGES}
+    missed = 0
+    time.sleep(0.5)
+    for n in range(taps):
+        key = keys[n % len(keys)]
+        played.clear()
+        probe.marks = {'tap': time.monotonic()}
+        simulation.tap(key)
+        if played.wait(5):
+            stages = probe.stages()
+            if stages is not None:
+                for stage, seconds in stages.items():
+                    results[stage].append(seconds)
+        else:
+            missed += 1
+        simulation.remove()
+        time.sleep(0.3)  # Every tag gets the debounce hold time before its next tap
+
+    find_times = []
+    for folder in simulation.tags.values():
+        directory = os.path.join(simulation.audio_folder, folder)
+        for _ in range(50):
+            start = time.perf_counter()
+            flick.music_library.files_under(directory)
+            find_times.append(time.perf_counter() - start)
+
+    shutil.rmtree(simulation.root, ignore_errors=True)  # The synthetic library
+
+    stages = {stage: summarize(values) for stage, values in results.items()}
+    stages['files_under'] = summarize(find_times)
+    return {'tracks': tracks, 'taps': taps, 'missed': missed, 'irq': irq,
+            'library_build_s': build_seconds, 'boot_s': boot_seconds, 'stages': stages}
+
+
+def git_version():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=here,
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def print_result(result, baseline=None):
+    print(f"{result['tracks']:7} tracks  boot {result['boot_s']:.2f} s  "
+          f"missed taps {result['missed']}/{result['taps']}")
+    for stage, summary in result['stages'].items():
+        if not summary['n']:
+            print(f'    {stage:16} no samples')
+            continue
+        line = (f"    {stage:16} p50 {summary['p50']:8.2f}  p95 {summary['p95']:8.2f}  "
+                f"p99 {summary['p99']:8.2f} ms")
+        previous = (baseline or {}).get('stages', {}).get(stage)
+        if previous and previous.get('n'):
+            line += f"   p50 {summary['p50'] - previous['p50']:+8.2f}  p99 {summary['p99'] - previous['p99']:+8.2f} ms"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='tap-to-audio latency on simulated hardware')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--taps', type=int, default=40)
+    parser.add_argument('--irq', action='store_true', help='IRQ tag detection instead of polling')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_child(args.child, args.taps, args.irq)))
+        return
+
+    baselines = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baselines = {result['tracks']: result for result in json.load(f)['results']}
+
+    results = []
+    for size in args.sizes:
+        # flick.py can only be imported once per process
+        command = [sys.executable, os.path.abspath(__file__), '--child', str(size), '--taps', str(args.taps)]
+        if args.irq:
+            command.append('--irq')
+        output = subprocess.run(command, capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f'{size} tracks failed:\n{output.stderr}')
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print_result(result, baselines.get(size))
+
+    if args.out:
+        report = {'version': git_version(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import math
+import time
+import logging
+import threading
+
+# Crossfading between albums with two VLC players.
+#
+# Crossfader stands in for the single media list player flick.py used to
+# have. It keeps two decks, each a media list player with its own media
+# player, and all calls and events go to the active one. A media list
+# set with crossfade=True is cued on the idle deck instead, and the next
+# play() starts it there at volume 0. It becomes the active deck while the
+# old one fades out and the new one fades in over `crossfade` seconds
+# (equal power), after which the old deck is stopped. A tag change starts
+# the new album right away instead of stopping the old one first.
+#
+# Events from the deck that is fading out are not passed on, so flick.py
+# only ever sees one player.
+
+CROSSFADE = 1.5   # Seconds, crossfade_seconds in global_config
+STEP = 0.04       # Seconds between volume changes during a fade
+VOLUME = 100
+
+
+class _DeckEvents(object):
+    """Event manager attaching to both decks, delivering only the active one's"""
+
+    def __init__(self, crossfader, managers):
+        self.crossfader = crossfader
+        self.managers = managers
+
+    def event_attach(self, event_type, callback, *args):
+        for deck, manager in enumerate(self.managers):
+            manager.event_attach(event_type, self._filter(deck, callback), *args)
+
+    def _filter(self, deck, callback):
+        def deliver(event, *args):
+            if self.crossfader.active == deck:
+                callback(event, *args)
+        return deliver
+
+
+class _ActiveMediaPlayer(object):
+    """The media player of whichever deck is active"""
+
+    def __init__(self, crossfader):
+        self.crossfader = crossfader
+        self.events = _DeckEvents(crossfader, [deck.get_media_player().event_manager()
+                                               for deck in crossfader.decks])
+
+    def event_manager(self):
+        return self.events
+
+    def get_media(self):
+        return self.crossfader.decks[self.crossfader.active].get_media_player().get_media()
+
+
+class Crossfader(object):
+    def __init__(self, instance, crossfade=CROSSFADE, volume=VOLUME, step=STEP):
+        self.decks = [instance.media_list_player_new(), instance.media_list_player_new()]
+        self.crossfade = crossfade
+        self.volume = volume
+        self.step = step
+        self.active = 0
+        self.cued = None       # Deck holding a media list for the next play()
+        self.fade = None       # (deck fading out, deck fading in, start time)
+        self.closed = False
+        self.lock = threading.Condition()
+        self.list_events = _DeckEvents(self, [deck.event_manager() for deck in self.decks])
+        self.media_player = _ActiveMediaPlayer(self)
+        for deck in self.decks:
+            deck.get_media_player().audio_set_volume(volume)
+        self.thread = threading.Thread(target=self._run, name='crossfade')
+        self.thread.daemon = True
+        self.thread.start()
+
+    # The parts of vlc.MediaListPlayer flick.py uses
+
+    def event_manager(self):
+        return self.list_events
+
+    def get_media_player(self):
+        return self.media_player
+
+    def set_media_list(self, media_list, crossfade=False):
+        """With crossfade, cue the list on the idle deck if something is playing"""
+        with self.lock:
+            if crossfade and self.crossfade > 0 and self.decks[self.active].is_playing():
+                idle = 1 - self.active
+                if self.fade is not None:
+                    self._end_fade()  # Still fading out from the last change, cut it
+                self.decks[idle].set_media_list(media_list)
+                self.cued = idle
+            else:
+                self.cued = None
+                self.decks[self.active].set_media_list(media_list)
+
+    def play(self):
+        with self.lock:
+            if self.cued is None:
+                self.decks[self.active].play()
+                return
+            out, into = self.active, self.cued
+            self.cued = None
+            self._volume(into, 0)
+            self.active = into  # Before play(), its first events come from libvlc's thread
+            self.decks[into].play()
+            self.fade = (out, into, time.monotonic())
+            self.lock.notify_all()
+        logging.debug(f'Crossfading over {self.crossfade:.1f} s')
+
+    def stop(self):
+        with self.lock:
+            self.cued = None
+            if self.fade is not None:
+                self._end_fade()
+            self.decks[self.active].stop()
+
+    def pause(self):
+        with self.lock:
+            if self.fade is not None:
+                self._end_fade()
+            self.decks[self.active].pause()
+
+    def is_playing(self):
+        return self.decks[self.active].is_playing()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+        self.thread.join(1.0)
+
+    # Fading, the caller holds self.lock
+
+    def _volume(self, deck, volume):
+        self.decks[deck].get_media_player().audio_set_volume(int(round(volume)))
+
+    def _end_fade(self):
+        out, into, started = self.fade
+        self.fade = None
+        self.decks[out].stop()
+        self._volume(out, self.volume)
+        self._volume(into, self.volume)
+
+    def _run(self):
+        with self.lock:
+            while not self.closed:
+                if self.fade is None:
+                    self.lock.wait()
+                    continue
+                out, into, started = self.fade
+                done = (time.monotonic() - started) / self.crossfade if self.crossfade > 0 else 1.0
+                if done >= 1.0:
+                    self._end_fade()
+                    continue
+                self._volume(out, self.volume * math.cos(done * math.pi / 2))
+                self._volume(into, self.volume * math.sin(done * math.pi / 2))
+                self.lock.wait(self.step)
@@ -0,0 +1,238 @@
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+# Keeps a LibraryIndex in sync with audio_folder while the player runs.
+#
+# With inotify every directory in the index gets a watch, and each event
+# is applied as a single add/remove/rename on the index, so the work done
+# is proportional to what changed. If inotify is unavailable (or we run
+# out of watches) we fall back to calling index.refresh() every
+# poll_interval seconds, which only lists directories whose mtime moved.
+#
+# cp -r and rsync create a directory and fill it straight away, before
+# its watch exists. New trees are therefore watched before they are
+# listed, and a refresh() follows a few seconds after a directory was
+# created for anything that still slipped through.
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_ONLYDIR
+
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class Inotify(object):
+    """Minimal ctypes wrapper around the inotify syscalls"""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Wait up to timeout seconds, returns [(wd, mask, cookie, name)]"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LibraryWatcher(threading.Thread):
+    """Background thread applying file system changes to a LibraryIndex
+
+    on_change is called (from this thread) after a batch of changes was
+    applied, e.g. to invalidate anything derived from the track list.
+    """
+
+    def __init__(self, index, poll_interval=60, save_delay=10, on_change=None, refresh_delay=5):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.index = index
+        self.poll_interval = poll_interval
+        self.save_delay = save_delay
+        self.on_change = on_change
+        self.stop_event = threading.Event()
+        self.inotify = None
+        self.watches = {}  # wd -> directory path
+        self.paths = {}    # directory path -> wd
+        self.last_change = None
+        self.refresh_delay = refresh_delay
+        self.refresh_at = None  # Set when a directory was created
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        try:
+            self.inotify = Inotify()
+            for path in self.index.directories():
+                self._watch(path)
+            logging.info(f'Watching {len(self.watches)} library directories with inotify')
+        except OSError as e:
+            logging.warning(f'inotify unavailable ({e}), polling the library every {self.poll_interval}s')
+            self._close_inotify()
+
+        while not self.stop_event.is_set():
+            try:
+                if self.inotify is not None:
+                    changed = self._handle_events(self.inotify.read(1.0))
+                    changed = self._maybe_refresh() or changed
+                else:
+                    self.stop_event.wait(self.poll_interval)
+                    changed = self.index.refresh() > 0
+                if changed:
+                    self.last_change = time.monotonic()
+                    if callable(self.on_change):
+                        self.on_change()
+                self._maybe_save()
+            except OSError as e:
+                if self.inotify is None:
+                    raise
+                # Most likely out of inotify watches (fs.inotify.max_user_watches)
+                logging.warning(f'inotify failed ({e}), polling the library every {self.poll_interval}s')
+                self._close_inotify()
+                self.index.refresh()
+            except Exception as e:
+                logging.error(f'Library watcher error: {e}')
+                self.stop_event.wait(1.0)
+
+        self.index.save()
+        self._close_inotify()
+
+    def _maybe_save(self):
+        # Batch index writes so an rsync of a whole album is one save
+        if self.last_change is None:
+            return
+        if self.stop_event.is_set() or time.monotonic() - self.last_change >= self.save_delay:
+            self.last_change = None
+            self.index.save()
+
+    def _maybe_refresh(self):
+        if self.refresh_at is None or time.monotonic() < self.refresh_at:
+            return False
+        self.refresh_at = None
+        changed = self.index.refresh() > 0
+        for path in self.index.directories():
+            self._watch(path)
+        return changed
+
+    def _watch_tree(self, path):
+        # Watch a new tree before it is listed, so files that arrive while
+        # it is listed produce events
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                self._watch(current)
+                with os.scandir(current) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except FileNotFoundError:
+                continue  # Already gone again
+
+    def _watch(self, path):
+        if path in self.paths:
+            return
+        wd = self.inotify.add_watch(path)
+        self.watches[wd] = path
+        self.paths[path] = wd
+
+    def _unwatch(self, path):
+        wd = self.paths.pop(path, None)
+        if wd is not None:
+            self.watches.pop(wd, None)
+            self.inotify.rm_watch(wd)
+
+    def _close_inotify(self):
+        if self.inotify is not None:
+            self.inotify.close()
+        self.inotify = None
+        self.watches = {}
+        self.paths = {}
+
+    def _handle_events(self, events):
+        changed = False
+        for wd, mask, cookie, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, resync from the directory mtimes
+                logging.warning('inotify queue overflow, refreshing library index')
+                self.index.refresh()
+                for path in self.index.directories():
+                    self._watch(path)
+                changed = True
+                continue
+            if mask & IN_IGNORED:
+                path = self.watches.pop(wd, None)
+                if path is not None and self.paths.get(path) == wd:
+                    del self.paths[path]
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+
+            # A rename arrives as MOVED_FROM + MOVED_TO, handled as remove + add.
+            # Moving into or out of audio_folder only produces one half.
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                if mask & IN_ISDIR:
+                    for removed in self.index.remove_dir(path):
+                        self._unwatch(removed)
+                    changed = True
+                else:
+                    changed = self.index.remove_file(path) or changed
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                if mask & IN_ISDIR:
+                    self._watch_tree(path)
+                    for added in self.index.add_dir(path):
+                        self._watch(added)
+                    if self.refresh_at is None:
+                        self.refresh_at = time.monotonic() + self.refresh_delay
+                    changed = True
+                else:
+                    changed = self.index.add_file(path) or changed
+        return changed
+
+
+def watch_library(index, **kwargs):
+    watcher = LibraryWatcher(index, **kwargs)
+    watcher.start()
+    return watcher
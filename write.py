@@ -1,51 +1,33 @@
-import board
-import busio
-from adafruit_pn532.i2c import PN532_I2C
+import nfcd
 
-# Create an I2C object
-i2c = busio.I2C(board.SCL, board.SDA)
-
-# Create the PN532 object
-pn532 = PN532_I2C(i2c, debug=False)
-
-# Configure PN532 to communicate with MiFare cards
-pn532.SAM_configuration()
+# The reader belongs to nfcd (run by flick.py, or python nfcd.py on its own)
+reader = nfcd.NfcClient()
 
 print("Place an NFC card to write...")
 
 try:
     while True:
         # Check if a card is available to write
-        uid = pn532.read_passive_target(timeout=0.5)
+        try:
+            uid = reader.scan(timeout=0.5)
+        except nfcd.NfcError as e:
+            if 'No NFC tag found' not in str(e):
+                raise
+            continue
 
         # If a card is found, ask the user for data to write
-        if uid is not None:
-            print("Found card with UID:", [hex(i) for i in uid])
-
-            # User input for data to write to the card
-            data_to_write = input("Enter data to write to the card: ")
+        print("Found card with UID:", [hex(i) for i in uid])
 
-            # Convert the string to bytes (UTF-8 encoding)
-            data_bytes = data_to_write.encode('utf-8')
+        # User input for data to write to the card
+        data_to_write = input("Enter data to write to the card: ")
 
-            # Write data to the card, 4 bytes per block
-            block_number = 4  # Start writing from block 4
-            for start_index in range(0, len(data_bytes), 4):
-                end_index = start_index + 4
-                block_data = data_bytes[start_index:end_index]
-                
-                # Ensure the block_data is 4 bytes long by padding if necessary
-                block_data += b'\0' * (4 - len(block_data))
+        # Only changed pages are written, then read back to verify
+        result = reader.write_payload(data_to_write, uid=uid, timeout=2.0)
 
-                pn532.ntag2xx_write_block(block_number, block_data)
-                block_number += 1
-
-            print("Data written to the card:", data_to_write)
-            break
+        print("Data written to the card:", data_to_write)
+        print(f"{result['written']}/{result['pages']} pages written, {result['transactions']} transactions, "
+              f"{result['seconds'] * 1000:.0f} ms")
+        break
 
 except Exception as e:
     print(f"Error: {e}")
-
-finally:
-    # Explicitly close the I2C connection
-    i2c.deinit()